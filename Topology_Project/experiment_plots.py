@@ -11,92 +11,119 @@ pf_precision, exception_match_rate
 """
 
 import os
+import hashlib
+from functools import lru_cache
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import make_scorer, accuracy_score
 from scipy.special import expit  # logistic sigmoid
-from sklearn.utils import resample
-
-def logistic_curve_plot(y_col, x_col, title, y_label, x_label, fname):
-    """Fit logistic regression model and plot probability curve for each topology."""
-    fig, ax = plt.subplots()
-    x_plot = np.linspace(df[x_col].min(), df[x_col].max(), 300)
-
-    for topo, g in df.groupby("topology"):
-        # Binary labels
-        X = g[[x_col]].values
-        y = g[y_col].astype(int).values
-
-        if len(np.unique(y)) == 1:
-            print(f"Skipping {topo} for {y_col} (only one class present).")
-            continue
-
-        # Fit logistic regression
-        model = LogisticRegression()
-        model.fit(X, y)
-
-        # Predict probabilities
-        y_prob = model.predict_proba(x_plot.reshape(-1, 1))[:, 1]
-        ax.plot(x_plot, y_prob, label=f"{topo} (logit)", linestyle="--")
-
-        # Also scatter the actual binned means for visual check
-        bins = np.linspace(X.min(), X.max(), 10)
-        g["bin"] = pd.cut(g[x_col], bins)
-        means = g.groupby("bin")[y_col].mean()
-        centers = [b.mid for b in means.index.categories]
-        ax.scatter(centers, means.values, label=f"{topo} (binned)", marker='o')
-
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    ax.set_title(title)
-    ax.legend(title="Topology")
-    fig.tight_layout()
-    fig.savefig(os.path.join(OUTPUT_DIR, fname), dpi=300, bbox_inches="tight")
-    if SHOW_FIGURES:
-        plt.show()
-    plt.close(fig)
 
 # ---------- Configuration ----------
 CSV_PATH = "experiment_results.csv"
 OUTPUT_DIR = "plots"
 SHOW_FIGURES = False  # flip to True if you want the script to display windows
+DPI = 150  # savefig resolution; raise to 300 for publication figures
 # -----------------------------------
 
 # Make sure we don't accidentally use any matplotlib styles
 plt.rcParams.update(plt.rcParamsDefault)
 
+# Render straight to files with Agg unless windows are wanted
+if not SHOW_FIGURES:
+    plt.switch_backend("Agg")
+
 # Create output dir
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Column types are applied while parsing so no post-hoc casting pass is needed.
+# topology is categorical (factorized once) and the low-cardinality integer
+# x-axes are narrow ints so every groupby below takes the fast code paths.
+CSV_DTYPES = {
+    "topology": "category",
+    "num_nodes": "int32",
+    "num_changes": "int16",
+    "input_tokens": "int32",
+    "avg_length": "float32",
+    "correct_initial_adj": "boolean",        # nullable: a blank cell stays <NA>
+    "correct_adj_after_changes": "boolean",  # instead of failing the parse
+    "tests_complete": "boolean",
+    "pf_precision": "float32",
+    "exception_match_rate": "float32",
+}
+
+# Typed copy of CSV_PATH, rebuilt when the CSV changes. The name carries a
+# hash of CSV_DTYPES so a cache written under an older schema is never read.
+SCHEMA_TAG = hashlib.blake2b(repr(sorted(CSV_DTYPES.items())).encode(), digest_size=4).hexdigest()
+CACHE_PATH = f"{CSV_PATH}.{SCHEMA_TAG}.parquet"
+
+def load_results(csv_path=CSV_PATH, cache_path=CACHE_PATH):
+    """Load the results CSV, reusing the Parquet cache when it is up to date."""
+    if (os.path.exists(cache_path)
+            and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path)):
+        return pd.read_parquet(cache_path)
+    try:
+        frame = pd.read_csv(csv_path, dtype=CSV_DTYPES, engine="pyarrow")
+    except ImportError:
+        frame = pd.read_csv(csv_path, dtype=CSV_DTYPES)
+    try:
+        frame.to_parquet(cache_path)
+    except ImportError:
+        pass  # no parquet engine installed; just re-parse the CSV next time
+    return frame
+
 # Load data
-df = pd.read_csv(CSV_PATH)
+df = load_results()
 
-# Ensure boolean columns are actually boolean
-bool_cols = [
+# Reuse the same topology GroupBy for every plot
+TOPO_GROUPS = df.groupby("topology", sort=True, observed=True)
+
+BIN_EDGES = np.arange(0, df["input_tokens"].max() + 1000, 1000)  # 0-49, 50-99, ...
+#    ↑ adjust the 50 to any bin width (or provide an explicit list)
+TOKEN_LABELS = [
+    f"{int(l)}–{int(r-1)}"       # pretty labels like “0–49”
+    for l, r in zip(BIN_EDGES[:-1], BIN_EDGES[1:])
+]
+# [l, r) bin ids straight from np.digitize, wrapped as an ordered categorical
+# over integer codes (no Interval objects); out-of-range values become NaN
+tokens = df["input_tokens"].to_numpy()
+token_codes = np.digitize(tokens, BIN_EDGES[1:-1])
+token_codes[(tokens < BIN_EDGES[0]) | (tokens >= BIN_EDGES[-1])] = -1
+df["token_range"] = pd.Categorical.from_codes(token_codes, categories=TOKEN_LABELS, ordered=True)
+
+# Per-cell sums and counts for every metric over every x-axis key, computed
+# in one pass. Plots re-aggregate from these cells instead of regrouping the
+# raw rows; summing sum/count (rather than averaging means) keeps each mean
+# weighted by rows, exactly as a direct groupby would.
+AGG_KEYS = ["topology", "num_nodes", "avg_length", "num_changes", "token_range"]
+AGG_COLS = [
     "correct_initial_adj",
     "correct_adj_after_changes",
     "tests_complete",
+    "pf_precision",
+    "exception_match_rate",
 ]
-for col in bool_cols:
-    if df[col].dtype != bool:
-        df[col] = df[col].astype(bool)
+AGG = (
+    df.groupby(AGG_KEYS, observed=True, dropna=False)[AGG_COLS]
+    .agg(["sum", "count"])
+    .astype("float64")  # plain floats: nullable sums would carry <NA> into matplotlib
+)
+
+def topo_means(y_col, x_col):
+    """Return mean(y_col) indexed by x_col with one column per topology."""
+    cells = AGG[y_col].groupby(level=[x_col, "topology"], observed=True).sum()
+    return (cells["sum"] / cells["count"]).unstack("topology").sort_index()
 
 # Helper to group and plot
 def line_plot(y_col, x_col, title, y_label, x_label, fname):
     """Plot mean(y_col) vs x_col for each topology."""
     fig, ax = plt.subplots()
-    for topo, g in df.groupby("topology"):
-        # Compute mean of y per x
-        summary = (
-            g.groupby(x_col)[y_col].mean().sort_index()
-        )  # mean of bool gives proportion
+    summary = topo_means(y_col, x_col)  # mean of bool gives proportion
+    for topo in summary.columns:
+        values = summary[topo].dropna()
         ax.plot(
-            summary.index,
-            summary.values,
+            values.index,
+            values.values,
             marker="o",
             label=topo,
         )
@@ -106,7 +133,7 @@ def line_plot(y_col, x_col, title, y_label, x_label, fname):
     ax.legend(title="Topology")
     fig.tight_layout()
     fig_path = os.path.join(OUTPUT_DIR, fname)
-    fig.savefig(fig_path, dpi=300, bbox_inches="tight")
+    fig.savefig(fig_path, dpi=DPI)
     if SHOW_FIGURES:
         plt.show()
     plt.close(fig)
@@ -115,32 +142,20 @@ def line_plot(y_col, x_col, title, y_label, x_label, fname):
 def scatter_plot(y_col, x_col, title, y_label, x_label, fname):
     """Scatter plot of mean(y_col) vs x_col for each topology – no connecting lines."""
     fig, ax = plt.subplots()
-    for topo, g in df.groupby("topology"):
-        summary = g.groupby(x_col)[y_col].mean().sort_index()
-        ax.scatter(summary.index, summary.values, marker="o", label=topo)  # <-- no lines
+    summary = topo_means(y_col, x_col)
+    for topo in summary.columns:
+        values = summary[topo].dropna()
+        ax.scatter(values.index, values.values, marker="o", label=topo, rasterized=True)  # <-- no lines
     ax.set_xlabel(x_label)
     ax.set_ylabel(y_label)
     ax.set_title(title)
     ax.legend(title="Topology")
     fig.tight_layout()
-    fig.savefig(os.path.join(OUTPUT_DIR, fname), dpi=300, bbox_inches="tight")
+    fig.savefig(os.path.join(OUTPUT_DIR, fname), dpi=DPI)
     if SHOW_FIGURES:
         plt.show()
     plt.close(fig)
 
-BIN_EDGES = np.arange(0, df["input_tokens"].max() + 1000, 1000)  # 0-49, 50-99, ...
-#    ↑ adjust the 50 to any bin width (or provide an explicit list)
-df["token_range"] = pd.cut(
-    df["input_tokens"],
-    bins=BIN_EDGES,
-    include_lowest=True,
-    right=False,                 # [0,50) style intervals
-    labels=[
-        f"{int(l)}–{int(r-1)}"   # pretty labels like “0–49”
-        for l, r in zip(BIN_EDGES[:-1], BIN_EDGES[1:])
-    ],
-)
-
 def binned_bar(y_col, title, y_label, fname):
     """
     Aggregate y_col by token_range and plot bars for each topology.
@@ -152,11 +167,11 @@ def binned_bar(y_col, title, y_label, fname):
     x = np.arange(len(token_levels))
     bar_width = 0.25
 
-    for i, (topo, g) in enumerate(df.groupby("topology")):
-        means = g.groupby("token_range")[y_col].mean().reindex(token_levels)
+    means = topo_means(y_col, "token_range").reindex(token_levels)
+    for i, topo in enumerate(means.columns):
         ax.bar(
             x + i * bar_width,
-            means.values,
+            means[topo].values,
             bar_width,
             label=topo,
         )
@@ -168,7 +183,75 @@ def binned_bar(y_col, title, y_label, fname):
     ax.set_title(title)
     ax.legend(title="Topology")
     fig.tight_layout()
-    fig.savefig(os.path.join(OUTPUT_DIR, fname), dpi=300, bbox_inches="tight")
+    fig.savefig(os.path.join(OUTPUT_DIR, fname), dpi=DPI)
+    if SHOW_FIGURES:
+        plt.show()
+    plt.close(fig)
+
+def fit_logit_1d(x, y, iters=8):
+    """
+    Fit P(y=1) = expit(b0 + b1 * x) by Newton-IRLS and return [b0, b1].
+    x is standardized internally so the 2x2 solve stays well conditioned.
+    """
+    mu, sigma = x.mean(), x.std() or 1.0
+    X = np.column_stack([np.ones_like(x), (x - mu) / sigma])
+    b = np.zeros(2)
+    for _ in range(iters):
+        p = expit(X @ b)
+        W = p * (1 - p)
+        b += np.linalg.solve((X.T * W) @ X + 1e-9 * np.eye(2), X.T @ (y - p))
+    return np.array([b[0] - b[1] * mu / sigma, b[1] / sigma])
+
+@lru_cache(maxsize=64)
+def _cached_logit_fit(x_bytes, y_bytes):
+    """Memoized fit_logit_1d keyed on the raw float64 buffers of x and y."""
+    return tuple(fit_logit_1d(np.frombuffer(x_bytes), np.frombuffer(y_bytes)))
+
+def logistic_curve_plot(y_col, x_col, title, y_label, x_label, fname, groups=TOPO_GROUPS):
+    """Fit logistic regression model and plot probability curve for each topology."""
+    fig, ax = plt.subplots()
+    x_plot = np.linspace(df[x_col].min(), df[x_col].max(), 300)
+
+    # Bin the whole column once (shared edges for every topology) and
+    # aggregate all topologies in a single groupby
+    bins = np.linspace(df[x_col].min(), df[x_col].max(), 10)
+    x_bins = pd.cut(df[x_col], bins)
+    binned = (
+        df.groupby([x_bins, "topology"], observed=False)[y_col]
+        .mean()
+        .astype("float64")
+        .unstack("topology")
+    )
+    centers = [b.mid for b in binned.index]
+
+    for topo, g in groups:
+        # Binary labels (rows with a missing label are left out of the fit)
+        y = g[y_col].to_numpy(dtype=np.float64, na_value=np.nan)
+        known = ~np.isnan(y)
+        X = g[x_col].to_numpy(dtype=np.float64)[known]
+        y = y[known]
+
+        if len(np.unique(y)) == 1:
+            print(f"Skipping {topo} for {y_col} (only one class present).")
+            continue
+        if len(y) < 20 or np.ptp(X) < 1e-9:
+            print(f"Skipping {topo} for {y_col} (insufficient data).")
+            continue
+
+        # Fit logistic regression and predict probabilities
+        b = _cached_logit_fit(X.tobytes(), y.tobytes())
+        y_prob = expit(b[0] + b[1] * x_plot)
+        ax.plot(x_plot, y_prob, label=f"{topo} (logit)", linestyle="--")
+
+        # Also scatter the actual binned means for visual check
+        ax.scatter(centers, binned[topo].values, label=f"{topo} (binned)", marker='o', rasterized=True)
+
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_title(title)
+    ax.legend(title="Topology")
+    fig.tight_layout()
+    fig.savefig(os.path.join(OUTPUT_DIR, fname), dpi=DPI)
     if SHOW_FIGURES:
         plt.show()
     plt.close(fig)
@@ -282,7 +365,7 @@ def bar_chart(values_dict, title, y_label, fname, group_labels=None):
     ax.set_title(title)
     fig.tight_layout()
     fig_path = os.path.join(OUTPUT_DIR, fname)
-    fig.savefig(fig_path, dpi=300, bbox_inches="tight")
+    fig.savefig(fig_path, dpi=DPI)
     if SHOW_FIGURES:
         plt.show()
     plt.close(fig)
@@ -290,14 +373,13 @@ def bar_chart(values_dict, title, y_label, fname, group_labels=None):
 # 1. Percentage correct adjacency before and after changes
 bar_width = 0.35
 fig, ax = plt.subplots()
-topologies = sorted(df["topology"].unique())
+# Whole-topology means come from the AGG cells too; no extra pass over the rows
+TOPO_CELLS = AGG.groupby(level="topology", observed=True).sum()
+TOPO_MEANS = TOPO_CELLS.xs("sum", axis=1, level=1) / TOPO_CELLS.xs("count", axis=1, level=1)
+topologies = list(TOPO_MEANS.index)
 x = np.arange(len(topologies))
-pre = []
-post = []
-for topo in topologies:
-    subset = df[df["topology"] == topo]
-    pre.append(subset["correct_initial_adj"].mean())
-    post.append(subset["correct_adj_after_changes"].mean())
+pre = TOPO_MEANS["correct_initial_adj"].values
+post = TOPO_MEANS["correct_adj_after_changes"].values
 
 ax.bar(x - bar_width / 2, pre, bar_width, label="Before Changes")
 ax.bar(x + bar_width / 2, post, bar_width, label="After Changes")
@@ -308,16 +390,13 @@ ax.set_title("Correct Adjacency Before vs After Changes by Topology")
 ax.legend()
 fig.tight_layout()
 fig_path = os.path.join(OUTPUT_DIR, "adjacency_before_after_bar.png")
-fig.savefig(fig_path, dpi=300, bbox_inches="tight")
+fig.savefig(fig_path, dpi=DPI)
 if SHOW_FIGURES:
     plt.show()
 plt.close(fig)
 
 # 2. Percentage of tests complete for each topology
-tests_complete_values = {
-    topo: df[df["topology"] == topo]["tests_complete"].mean()
-    for topo in topologies
-}
+tests_complete_values = TOPO_MEANS["tests_complete"].to_dict()
 bar_chart(
     tests_complete_values,
     "Percentage of Tests Complete by Topology",
@@ -326,10 +405,7 @@ bar_chart(
 )
 
 # 3. Average precision of each topology
-precision_values = {
-    topo: df[df["topology"] == topo]["pf_precision"].mean()
-    for topo in topologies
-}
+precision_values = TOPO_MEANS["pf_precision"].to_dict()
 bar_chart(
     precision_values,
     "Average PF Precision by Topology",
@@ -339,5 +415,5 @@ bar_chart(
 
 print(f"All plots saved to '{OUTPUT_DIR}/' directory.")
 
-print( df.groupby("topology")["correct_adj_after_changes"].value_counts(dropna=False))
-print( df.groupby("topology")["tests_complete"].value_counts(dropna=False))
+print( TOPO_GROUPS["correct_adj_after_changes"].value_counts(dropna=False))
+print( TOPO_GROUPS["tests_complete"].value_counts(dropna=False))
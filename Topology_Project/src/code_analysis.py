@@ -1,10 +1,16 @@
 import ast
-import random
-from gen import DATA_TYPES, generate_code_from_nodes
+import functools
+from src.gen import DATA_TYPES, generate_code_from_nodes, trial_random, _RAND
 
-def modify_codebase(original_code, node_list, adjacency_list, num_changes, use_comments=False):
+# For each type, the types a mutation may switch it to (everything but itself)
+_ALTERNATIVE_TYPES = {t: tuple(o for o in DATA_TYPES if o != t) for t in DATA_TYPES}
+
+def modify_codebase(original_code, node_list, adjacency_list, num_changes, use_comments=False, seed=None):
     """
     Modify the output type of random nodes, and regenerate the code accordingly.
+    With a seed (from gen.trial_seed), the picks and the regenerated code
+    draw only from generators seeded with it, so they do not depend on what
+    other threads are generating.
     
     Returns:
         new_code (str): Updated Python code with new output types
@@ -12,94 +18,98 @@ def modify_codebase(original_code, node_list, adjacency_list, num_changes, use_c
         new_node_list (list): Updated list of nodes with modified output types
         adjacency_list (list): Unchanged
     """
-    new_node_list = node_list[:]
-    num_nodes = len(new_node_list)
-    change_indices = random.sample(range(num_nodes), min(num_changes, num_nodes))
-
-    for i in change_indices:
-        name, obj_type, input_type, current_output = new_node_list[i]
-        new_output = random.choice([t for t in DATA_TYPES if t != current_output])
-        new_node_list[i] = (name, obj_type, input_type, new_output)
-
-    new_code = generate_code_from_nodes(new_node_list, adjacency_list, use_comments=use_comments)
+    with trial_random(seed):
+        new_node_list = node_list[:]
+        num_nodes = len(new_node_list)
+        change_indices = _RAND.rng.choice(num_nodes, size=min(num_changes, num_nodes), replace=False)
+        # a type outside DATA_TYPES (e.g. a hand-built node list) may become any of them
+        alternatives = [_ALTERNATIVE_TYPES.get(new_node_list[i][3], DATA_TYPES) for i in change_indices]
+        picks = _RAND.rng.integers(0, [len(choices) for choices in alternatives]) if alternatives else ()
+
+        for i, choices, pick in zip(change_indices, alternatives, picks):
+            name, obj_type, input_type, current_output = new_node_list[i]
+            new_node_list[i] = (name, obj_type, input_type, choices[pick])
+
+        new_code = generate_code_from_nodes(new_node_list, adjacency_list, use_comments=use_comments)
     return new_code, len(change_indices), new_node_list, adjacency_list
 
+# AST node types with nothing below them that extract_graph cares about
+_LEAF_NODES = (
+    ast.Name, ast.Constant, ast.expr_context, ast.operator,
+    ast.unaryop, ast.boolop, ast.cmpop, ast.alias,
+)
+
 def extract_graph(code_str):
     """
     Parse code_str to AST, collect:
       - nodes: all top-level FunctionDef and ClassDef names
       - edges: [(parent, child)] whenever child’s body calls parent
     Returns (nodes_list, adjacency_list_as_dicts).
+
+    The parse is memoized on the source text; each call still returns fresh
+    lists/dicts so callers may mutate the result.
     """
+    nodes, edges = _extract_graph_cached(code_str)
+    return list(nodes), [{"from": parent, "to": child} for parent, child in edges]
+
+@functools.lru_cache(maxsize=256)
+def _extract_graph_cached(code_str):
+    """Pure worker behind extract_graph; returns (nodes, edges) as tuples."""
     tree = ast.parse(code_str)
 
-    class GraphBuilder(ast.NodeVisitor):
-        """
-        Builds a call graph.
-        • Nodes  = every top-level def or class name.
-        • Edge   (parent, child) is added when child calls parent.
-        • Special rule: a bare call to  run()  inside a class body counts as a
-            call to *that class*, not to a literal node called "run".
-        """
-        def __init__(self):
-            self.node_types    = {}          # name -> "function" | "class"
-            self.edges         = []          # list[(parent, child)]
-            self.instance_maps = {}          # container -> {var -> class}
-            self.current       = None        # where we are right now
-            self.class_stack   = []          # nested class names
+    # Call graph state.
+    #   • Nodes  = every top-level def or class name.
+    #   • Edge   (parent, child) is added when child calls parent.
+    #   • Special rule: a bare call to  run()  inside a class body counts as a
+    #       call to *that class*, not to a literal node called "run".
+    node_types    = {}          # name -> "function" | "class"
+    edges         = []          # list[(parent, child)]
+    instance_maps = {}          # container -> {var -> class}
+
+    # Pre-order walk with an explicit stack instead of ast.NodeVisitor: each
+    # entry carries where we are right now (current) and the nested class
+    # names (class_stack), so every node costs one isinstance dispatch rather
+    # than a visit_* lookup plus a recursive generic_visit call.
+    stack = [(tree, None, ())]
+    while stack:
+        node, current, class_stack = stack.pop()
 
         # ── class definitions ──────────────────────────────────────────────
-        def visit_ClassDef(self, node):
-            self.node_types[node.name] = "class"
-            self.class_stack.append(node.name)
-
-            prev, self.current = self.current, node.name
-            self.instance_maps[self.current] = {}
-            self.generic_visit(node)
-            self.current = prev
-            self.class_stack.pop()
+        if isinstance(node, ast.ClassDef):
+            node_types[node.name] = "class"
+            class_stack = class_stack + (node.name,)
+            current = node.name
+            instance_maps[current] = {}
 
         # ── functions / methods ────────────────────────────────────────────
-        def visit_FunctionDef(self, node):
-            # ── CASE 1: method inside a class ────────────────────────────────
-            if self.class_stack:
-                # Do *not* create a new node; keep using the class name
-                # that is already at the top of the stack.
-                self.generic_visit(node)          # still traverse the body
-                return                            # early-exit
-
-            # ── CASE 2: top-level function ──────────────────────────────────
-            self.node_types[node.name] = "function"
-            prev, self.current = self.current, node.name
-            self.instance_maps[self.current] = {}
-            self.generic_visit(node)
-            self.current = prev
+        elif isinstance(node, ast.FunctionDef):
+            # Methods do *not* create a new node; they keep using the class
+            # name that is already at the top of the stack.
+            if not class_stack:
+                node_types[node.name] = "function"
+                current = node.name
+                instance_maps[current] = {}
 
         # ── variable = ClassName() ─────────────────────────────────────────
-        def visit_Assign(self, node):
-            if (self.current and len(node.targets) == 1
+        elif isinstance(node, ast.Assign):
+            if (current and len(node.targets) == 1
                 and isinstance(node.targets[0], ast.Name)
                 and isinstance(node.value, ast.Call)
                 and isinstance(node.value.func, ast.Name)):
                 cls = node.value.func.id
-                if self.node_types.get(cls) == "class":
-                    inst = node.targets[0].id
-                    self.instance_maps[self.current][inst] = cls
-            self.generic_visit(node)
-
-        # ── function / method calls ────────────────────────────────────────
-        def visit_Call(self, node):
-            if not self.current:                 # skip top-level expressions
-                return self.generic_visit(node)
+                if node_types.get(cls) == "class":
+                    instance_maps[current][node.targets[0].id] = cls
 
+        # ── function / method calls (top-level expressions are skipped) ────
+        elif isinstance(node, ast.Call) and current:
             # ── 1) bare identifier call  foo(...)
             if isinstance(node.func, ast.Name):
                 callee = node.func.id
-                if callee == "run" and self.class_stack:      # ← inside a class
-                    callee = self.class_stack[-1]             #   map to class
+                if callee == "run" and class_stack:           # ← inside a class
+                    callee = class_stack[-1]                  #   map to class
                 # keep bare-function run() at top level as "run"
-                if callee in self.node_types:
-                    self.edges.append((callee, self.current))
+                if callee in node_types:
+                    edges.append((callee, current))
 
             # ── 2) attribute call  inst.run(...)
             elif isinstance(node.func, ast.Attribute) and node.func.attr == "run":
@@ -107,40 +117,43 @@ def extract_graph(code_str):
 
                 # (a) try to resolve inst ➜ class via instance_maps
                 if isinstance(node.func.value, ast.Name):
-                    inst = node.func.value.id
-                    parent_cls = self.instance_maps[self.current].get(inst)
+                    parent_cls = instance_maps[current].get(node.func.value.id)
 
                 # (b) fallback: if we’re *inside* a class method and the call is
                 #     self.run()  or SomeOtherObj.run() that couldn’t be resolved,
                 #     use the *enclosing class* instead of literal "run"
-                if not parent_cls and self.class_stack:
-                    parent_cls = self.class_stack[-1]
-
-                if parent_cls and parent_cls in self.node_types:
-                    self.edges.append((parent_cls, self.current))
+                if not parent_cls and class_stack:
+                    parent_cls = class_stack[-1]
 
-            self.generic_visit(node)
+                if parent_cls and parent_cls in node_types:
+                    edges.append((parent_cls, current))
 
-    builder = GraphBuilder()
-    builder.visit(tree)
+        # Push children reversed so they pop in source order; leaves that can
+        # never hold a def, assignment or call are not pushed at all
+        children = [
+            (child, current, class_stack)
+            for child in ast.iter_child_nodes(node)
+            if not isinstance(child, _LEAF_NODES)
+        ]
+        children.reverse()
+        stack.extend(children)
 
-    nodes = list(builder.node_types.keys())
-    adjacency = [
-        {"from": parent, "to": child} for parent, child in builder.edges
-    ]
-    return nodes, adjacency
+    return tuple(node_types), tuple(edges)
 
 
-def modify_and_extract(code_str, num_changes=1):
+def modify_and_extract(code_str, node_list, adjacency_list, num_changes=1, use_comments=False, seed=None):
     """
-    Performs both the AST-based call mutation and then re‑extracts the
-    updated node list and adjacency list.
+    Performs the output-type mutation and then re‑extracts the updated node
+    list and adjacency list. modify_codebase regenerates the source straight
+    from the node list, so the new code is parsed exactly once, here.
     Returns:
       modified_source (str),
       changes_made (int),
       nodes (List[str]),
       adjacency (List[{"from": str, "to": str}])
     """
-    modified_source, changes = modify_codebase(code_str, num_changes)
+    modified_source, changes, _, _ = modify_codebase(
+        code_str, node_list, adjacency_list, num_changes, use_comments=use_comments, seed=seed
+    )
     nodes, adjacency = extract_graph(modified_source)
     return modified_source, changes, nodes, adjacency
@@ -1,9 +1,16 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, repeat
 import json
-from src.utils import log_result
+import orjson
+import numpy as np
+from src.utils import extend_data_dict, log_result, new_results
 from src.code_analysis import modify_and_extract
-from src.graph_utils import _normalise_adj, _without_main, flip_adjacency, safe_flip, compute_match_percentage
+from src.gen import trial_random, trial_seed
+from src.graph_utils import _adj_pairs, pair_set, same_edge_set, flip_adjacency, safe_flip, compute_match_percentage
 from src.test_engine import run_llm_tests, precision_and_err_rate, static_completeness_ok
-from src.llm_interface import send_message
+from src.llm_interface import send_message_async
 from pydantic import BaseModel
 
 class CodeProperties(BaseModel):
@@ -15,120 +22,283 @@ class CodePropertiesWithTests(BaseModel):
     adjacency: dict
     tests: dict
 
-def run_topology_experiment_with_provider(topology_mode, codebase_generator, client, structured_prompt, structured_prompt_2, ai_data, avg_length, num_changes, provider, model, debug_callback=None,use_semantics=False):
-    for obj_count in range(10, 51, 5):
-        code, nodes, adj = codebase_generator(
-            num_objects=obj_count,
-            avg_length=avg_length,
-            branching_factor=0,
-            loop_factor=0,
-            connectivity=1.0 if topology_mode != "random" else 0.6,
-            topology_mode=topology_mode
-        )
+logger = logging.getLogger(__name__)
 
-        tokens = len(code.encode("utf-8"))
-        if tokens >= 50000:
-            continue
+OBJ_COUNTS = range(10, 51, 5)
+MAX_CONCURRENCY = 4              # LLM requests in flight per sweep
+BATCH_CONCURRENCY = 20           # ... and across all sweeps of run_topology_experiments
+TOKEN_LIMIT = 50000              # skip codebases at or above this many bytes
+
+# Shared by every request: providers with automatic prefix caching (OpenAI,
+# Anthropic) can only reuse it when the prefix is byte-identical across calls.
+_SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful assistant specialized in Python. Only return valid JSON conforming to the CodeProperties schema."}
+
+def run_topology_experiment_with_provider(topology_mode, codebase_generator, client, structured_prompt, structured_prompt_2, ai_data, avg_length, num_changes, provider, model, debug_callback=None,use_semantics=False, max_concurrency=MAX_CONCURRENCY):
+    """
+    Sweep obj_count over OBJ_COUNTS for one topology. The LLM round-trips of
+    the different sizes are independent, so they run concurrently (at most
+    max_concurrency requests in flight), each one filling its own row of a
+    preallocated results array; the rows are logged and merged into ai_data
+    in obj_count order once all are done.
 
-        ai_data["Number of Nodes"].append(len(nodes))
-        ai_data["Avg Length"].append(avg_length)
-        ai_data["Input Tokens"].append(tokens)
+    Codebases are generated in increasing obj_count order and code size grows
+    with it, so the sweep stops at the first one over TOKEN_LIMIT. The random
+    topology is not strictly monotonic and stops after two overshoots in a row.
+    """
+    async def sweep():
+        sem = asyncio.Semaphore(max_concurrency)
+        return await _sweep(sem, topology_mode, codebase_generator, client, structured_prompt, structured_prompt_2, avg_length, num_changes, provider, model, debug_callback)
 
-        gold_adj = {"from": [], "to": []}
-        for index, parents in enumerate(adj):
-            for parent in parents:
-                gold_adj["from"].append(parent)
-                gold_adj["to"].append(index)
+    results, outcomes = asyncio.run(sweep())
+    _record_sweep(topology_mode, ai_data, results, outcomes)
 
-        conversation = [
-            {"role": "system", "content": "You are a helpful assistant specialized in Python. Only return valid JSON conforming to the CodeProperties schema."},
-            {"role": "user", "content": structured_prompt}
-        ]
+def run_topology_experiments(experiments, max_concurrency=BATCH_CONCURRENCY, on_recorded=None):
+    """
+    Run several sweeps at once. experiments is a sequence of keyword-argument
+    dicts for run_topology_experiment_with_provider; the LLM requests of all
+    of them share one pool of max_concurrency slots, so a whole grid of
+    sweeps costs about its slowest round-trips instead of the sum of them.
+    Each sweep is logged and merged into its ai_data in the order given, as
+    soon as it and every sweep before it are done, and then passed to
+    on_recorded (if given), which runs in a worker thread so a blocking
+    callback (e.g. append_checkpoint's flush and fsync) does not stall the
+    other sweeps' requests.
+    """
+    async def run_all():
+        # Replies are awaited in worker threads (the SDK clients block), so
+        # make sure there are enough of them to keep every slot busy
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2 * max_concurrency))
+        sem = asyncio.Semaphore(max_concurrency)
+        sweeps = []
+        for experiment in experiments:
+            kwargs = {k: v for k, v in experiment.items() if k not in ("ai_data", "use_semantics", "max_concurrency")}
+            sweeps.append(asyncio.create_task(_sweep(sem, **kwargs)))
 
+        for experiment, sweep in zip(experiments, sweeps):
+            try:
+                results, outcomes = await sweep
+            except Exception as e:
+                print(f"[ERROR - {experiment['topology_mode'].upper()} SWEEP]:", e)
+                continue
+            _record_sweep(experiment["topology_mode"], experiment["ai_data"], results, outcomes)
+            if on_recorded:
+                await asyncio.to_thread(on_recorded, experiment)
+
+    asyncio.run(run_all())
+
+async def _sweep(sem, topology_mode, codebase_generator, client, structured_prompt, structured_prompt_2, avg_length, num_changes, provider, model, debug_callback=None):
+    """
+    The body of one sweep, with its requests gated by sem. Returns the
+    results array and a {row: outcome} dict of the rows that were run.
+    """
+    results = new_results(len(OBJ_COUNTS))
+    max_overshoots = 2 if topology_mode == "random" else 1
+    tasks = {}
+    overshoots = 0
+    for row, obj_count in enumerate(OBJ_COUNTS):
+        # Every trial draws from its own generators, seeded from gen.seed() and
+        # the trial, so its code does not depend on how the sweeps interleave
+        seed = trial_seed(topology_mode, avg_length, num_changes, obj_count)
         try:
-            reply = send_message(client, provider, conversation, model)
-            conversation.append({"role": "assistant", "content": reply})
-            if debug_callback:
-                debug_callback(
-                    f"Initial Adjacency - {topology_mode.upper()} | Nodes: {len(nodes)} | AvgLen: {avg_length}",
-                    gold_adj,
-                    reply
+            with trial_random(seed):
+                code, nodes, adj = codebase_generator(
+                    num_objects=obj_count,
+                    avg_length=avg_length,
+                    branching_factor=0,
+                    loop_factor=0,
+                    connectivity=1.0 if topology_mode != "random" else 0.6,
+                    topology_mode=topology_mode
                 )
+        except Exception as e:
+            print(f"[ERROR - OBJ_COUNT {obj_count}]:", e)
+            continue
+
+        # UTF-8 byte count; isascii() is a constant-time flag check, so the
+        # (usual) all-ASCII source skips building a throwaway bytes copy
+        tokens = len(code) if code.isascii() else len(code.encode("utf-8"))
+        if tokens >= TOKEN_LIMIT:
+            overshoots += 1
+            if overshoots >= max_overshoots:
+                break
+            continue
+        overshoots = 0
+
+        tasks[row] = asyncio.create_task(
+            _run_one(sem, results[row], code, nodes, adj, tokens, topology_mode, client, structured_prompt, structured_prompt_2, avg_length, num_changes, provider, model, debug_callback, seed)
+        )
+        await asyncio.sleep(0)       # let it send its request while the next codebase is generated
+    outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return results, dict(zip(tasks, outcomes))
 
-            parsed = json.loads(reply)
-            validated = CodeProperties(**parsed)
+def _record_sweep(topology_mode, ai_data, results, outcomes):
+    """Log the finished rows of a sweep and merge them into ai_data."""
+    keep = np.zeros(len(OBJ_COUNTS), dtype=bool)
+    for row, obj_count in enumerate(OBJ_COUNTS):
+        if row not in outcomes:                  # over the token budget or not generated
+            continue
+        result = outcomes[row]
+        if isinstance(result, Exception):
+            print(f"[ERROR - OBJ_COUNT {obj_count}]:", result)
+            continue
+        keep[row] = True
+        if result:
+            log_result(topology_mode.capitalize(), results[row])
+    extend_data_dict(ai_data, results[keep])
 
-            if not isinstance(parsed.get("adjacency"), dict):
-                raise ValueError("LLM response missing 'adjacency' dict")
-            from_list = parsed["adjacency"].get("from")
-            to_list = parsed["adjacency"].get("to")
+async def _run_one(sem, record, code, nodes, adj, tokens, topology_mode, client, structured_prompt, structured_prompt_2, avg_length, num_changes, provider, model, debug_callback, seed=None):
+    """
+    One obj_count step of the sweep, written into its own results record.
+    Each LLM round-trip holds sem while it is in flight, so while this step
+    waits on its modified-stage reply the other steps' initial requests go
+    out. The code mutation only depends on the generated code, so it runs in
+    a worker thread while the initial request is in flight, drawing from
+    generators seeded with the trial's seed. Returns whether the record
+    should be logged.
+    """
+    record["num_nodes"] = len(nodes)
+    record["avg_length"] = avg_length
+    record["input_tokens"] = tokens
 
-            if not isinstance(from_list, list) or not isinstance(to_list, list):
-                raise ValueError("'from' and 'to' must be lists")
+    # Keys this trial's replies in the response cache: the prompts are the same
+    # for every trial, so without it all trials would share one cached sample.
+    # The seed is deterministic under gen.seed(), so a re-run of the same
+    # seeded trial may reuse its replies; unseeded runs never share one.
+    trial = [topology_mode, avg_length, num_changes, seed]
 
-            if len(from_list) != len(to_list):
-                raise ValueError("Mismatch in 'from' and 'to' lengths")
+    mutation_seed = None if seed is None else trial_seed(seed, "mutation")
+    mod_task = asyncio.create_task(asyncio.to_thread(modify_and_extract, code, nodes, adj, num_changes, seed=mutation_seed))
+    conversation = await _initial_stage(sem, record, nodes, adj, topology_mode, client, structured_prompt, avg_length, provider, model, debug_callback, trial)
+    if not conversation:
+        mod_task.cancel()
+        return False
+    await _modified_stage(sem, record, conversation, mod_task, topology_mode, client, structured_prompt_2, provider, model, debug_callback, trial)
+    return True
 
-            parsed["adjacency"] = {
-                "from": [int(f) for f in from_list if isinstance(f, int) or (isinstance(f, str) and f.isdigit())],
-                "to": [int(t) for t in to_list if isinstance(t, int) or (isinstance(t, str) and t.isdigit())]
-            }
+async def _initial_stage(sem, record, nodes, adj, topology_mode, client, structured_prompt, avg_length, provider, model, debug_callback, trial=None):
+    """
+    Score the initial adjacency reply. Returns the conversation so far for
+    the modified stage, or None if the reply could not be used.
+    """
+    gold_adj = {
+        "from": list(chain.from_iterable(adj)),
+        "to": list(chain.from_iterable(repeat(index, len(parents)) for index, parents in enumerate(adj))),
+    }
+    gold_pairs = pair_set(gold_adj["from"], gold_adj["to"])
 
-            gold_pairs = set(_without_main(_normalise_adj(gold_adj)))
-            llm_pairs = set(_without_main(_normalise_adj(parsed["adjacency"])))
-            match_percent = compute_match_percentage(gold_pairs, llm_pairs)
-            ai_data["Adjacency Match %"].append(match_percent)
+    conversation = [_SYSTEM_MESSAGE, {"role": "user", "content": structured_prompt}]
 
-        except Exception as e:
-            print("[ERROR - INITIAL EXTRACTION]:", e)
-            ai_data["Correct Adjacency?"].append(False)
-            ai_data["Number of Changes"].append(0)
-            ai_data["Correct After Changes?"].append(False)
-            return
-
-        new_code, changes, new_nodes, new_adj = modify_and_extract(code, num_changes)
-        ai_data["Number of Changes"].append(changes)
+    try:
+        async with sem:
+            reply, cached_tokens = await send_message_async(client, provider, conversation, model, trial)
+        record["cached_tokens"] += cached_tokens
+        conversation.append({"role": "assistant", "content": reply})
+        if debug_callback:
+            debug_callback(
+                f"Initial Adjacency - {topology_mode.upper()} | Nodes: {len(nodes)} | AvgLen: {avg_length}",
+                gold_adj,
+                reply
+            )
+
+        validated = CodeProperties.model_validate_json(reply)
+
+    except Exception as e:
+        print("[ERROR - INITIAL EXTRACTION]:", e)
+        return None
+
+    ok, adjacency = _validate_adj(validated.adjacency)
+    if not ok:
+        print("[ERROR - INITIAL EXTRACTION]:", adjacency)
+        return None
+
+    llm_pairs = frozenset(_adj_pairs(adjacency))
+    record["adj_match"] = compute_match_percentage(gold_pairs, llm_pairs)
+    record["correct_adj"] = llm_pairs == gold_pairs
+
+    return conversation
+
+async def _modified_stage(sem, record, conversation, mod_task, topology_mode, client, structured_prompt_2, provider, model, debug_callback, trial=None):
+    """Score the follow-up reply against the mutated code from mod_task."""
+    try:
+        new_code, changes, new_nodes, new_adj = await mod_task
+        record["num_changes"] = changes
         conversation.append({"role": "user", "content": structured_prompt_2})
 
+        async with sem:
+            reply, cached_tokens = await send_message_async(client, provider, conversation, model, trial)
+        record["cached_tokens"] += cached_tokens
+        if debug_callback:
+            debug_callback(
+                f"Modified Adjacency - {topology_mode.upper()} | Nodes: {len(new_nodes)} | Changes: {changes}",
+                new_adj,
+                reply
+            )
+
+        parsed_new = _loads(reply)
+
         try:
-            reply = send_message(client, provider, conversation, model)
-            if debug_callback:
-                debug_callback(
-                    f"Modified Adjacency - {topology_mode.upper()} | Nodes: {len(new_nodes)} | Changes: {changes}",
-                    new_adj,
-                    reply
-                )
+            parsed_new["adjacency"] = flip_adjacency(parsed_new["adjacency"])
+        except:
+            parsed_new["adjacency"] = safe_flip(parsed_new["adjacency"])
 
-            parsed_new = json.loads(reply)
+        record["correct_after"] = same_edge_set(_adj_pairs(new_adj), _adj_pairs(parsed_new["adjacency"]))
 
-            try:
-                parsed_new["adjacency"] = flip_adjacency(parsed_new["adjacency"])
-            except:
-                parsed_new["adjacency"] = safe_flip(parsed_new["adjacency"])
+        complete = static_completeness_ok(parsed_new, new_nodes)
+        test_results = await asyncio.to_thread(run_llm_tests, new_code, parsed_new)
+        precision, err_rate = precision_and_err_rate(test_results)
+        record["tests_complete"] = complete
+        record["pf_precision"] = precision
+        record["exception_rate"] = err_rate
 
-            gold = set(_without_main(_normalise_adj(new_adj)))
-            pred = set(_without_main(_normalise_adj(parsed_new["adjacency"])))
-            ai_data["Correct After Changes?"].append(gold == pred)
+    except Exception as e:
+        print("[ERROR - MODIFIED EXTRACTION]:", e)
 
-            complete = static_completeness_ok(parsed_new, new_nodes)
-            test_results = run_llm_tests(new_code, parsed_new)
-            precision, err_rate = precision_and_err_rate(test_results)
-            ai_data["Tests Complete?"].append(complete)
-            ai_data["Pass/Fail Precision"].append(precision)
-            ai_data["Exception Match Rate"].append(err_rate)
+def _validate_adj(adjacency):
+    """
+    Check and sanitize an LLM {"from", "to"} adjacency without raising.
+    Returns (True, adjacency) with int-coerced, aligned lists, or
+    (False, reason).
+    """
+    if not isinstance(adjacency, dict):
+        return False, "adjacency must be an object with 'from' and 'to'"
+    from_list = adjacency.get("from")
+    to_list = adjacency.get("to")
+    if not isinstance(from_list, list) or not isinstance(to_list, list):
+        return False, "'from' and 'to' must be lists"
+    if len(from_list) != len(to_list):
+        return False, "Mismatch in 'from' and 'to' lengths"
 
-        except Exception as e:
-            print("[ERROR - MODIFIED EXTRACTION]:", e)
-            ai_data["Correct After Changes?"].append(False)
+    # keep an edge only if both ends are int-like, so 'from' and 'to' stay aligned
+    pairs = [(int(f), int(t)) for f, t in zip(from_list, to_list) if _is_intlike(f) and _is_intlike(t)]
+    return True, {"from": [f for f, _ in pairs], "to": [t for _, t in pairs]}
+
+def _is_intlike(x):
+    """True for ints and digit-only strings (bools excluded)."""
+    return x.__class__ is int or (x.__class__ is str and x.isdigit())
+
+def _loads(reply):
+    """Parse with orjson; fall back to json for the non-standard literals it rejects (NaN, Infinity)."""
+    try:
+        return orjson.loads(reply)
+    except orjson.JSONDecodeError:
+        return json.loads(reply)
+
+class _LazyJson:
+    """Pretty-prints its value only when the log record is actually formatted."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
 
-        log_result(topology_mode.capitalize(), len(nodes), avg_length, tokens, changes, ai_data)
+    def __str__(self):
+        return orjson.dumps(self.value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
 
 def display_debug_info(title, adjacency, response=None):
-    print("\n" + "=" * 60)
-    print(f"{title}")
-    print("Adjacency Matrix:")
-    print(json.dumps(adjacency, indent=2))
-    if response:
-        print("\nLLM Response:")
-        print(response)
-    print("=" * 60 + "\n")
+    """Debug callback; logs at DEBUG on this module's logger, so it costs nothing when that level is off."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug(
+        "\n%s\n%s\nAdjacency Matrix:\n%s%s\n%s\n",
+        "=" * 60, title, _LazyJson(adjacency),
+        f"\n\nLLM Response:\n{response}" if response else "",
+        "=" * 60,
+    )
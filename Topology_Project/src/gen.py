@@ -5,17 +5,111 @@ A complete Python script that generates a toy codebase with user-defined topolog
 """
 
 import random
-import string
 import math
 import cmath
+import hashlib
+import threading
+import io
 from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Seeded from the stdlib generator, so random.seed() before import pins it too;
+# seed() below re-seeds both in place.
+_RNG = np.random.default_rng(random.getrandbits(64))
+
+class _RandSource(threading.local):
+    """
+    The generators this module (and code_analysis) draw from: 'rng', a NumPy
+    Generator, and 'py', a stdlib random.Random (or the random module
+    itself). Also hands out uniforms, small ints and lowercase letters from
+    blocks drawn from rng in one NumPy call each, instead of one Mersenne
+    Twister call per token. A threading.local, so trial_random() in one
+    worker thread never changes what another thread draws.
+    """
+
+    BATCH = 4096
+
+    def __init__(self, rng, py=random):
+        self.reset(rng, py)
+
+    def reset(self, rng, py):
+        """Draw from rng and py from now on, dropping any buffered values."""
+        self.rng, self.py = rng, py
+        self._uniforms, self._u = [], 0
+        self._letters, self._l = b"", 0
+
+    def random(self):
+        """Uniform float in [0, 1)."""
+        if self._u == len(self._uniforms):
+            self._uniforms, self._u = self.rng.random(self.BATCH).tolist(), 0
+        value = self._uniforms[self._u]
+        self._u += 1
+        return value
+
+    def randint(self, low, high):
+        """Integer in [low, high], both inclusive like random.randint."""
+        return low + int(self.random() * (high - low + 1))
+
+    def letters(self, length):
+        """String of 'length' random lowercase ASCII letters."""
+        if self._l + length > len(self._letters):
+            size = max(self.BATCH, length)
+            self._letters, self._l = (self.rng.integers(0, 26, size=size, dtype=np.uint8) + ord("a")).tobytes(), 0
+        text = self._letters[self._l:self._l + length].decode("ascii")
+        self._l += length
+        return text
+
+
+_RAND = _RandSource(_RNG)
+_SEED = random.getrandbits(64)           # run seed that trial_seed() mixes into every trial
+
+def seed(value):
+    """
+    Seed the run: the stdlib random module, _RNG (in place) and the calling
+    thread's _RAND, and the base that trial_seed() derives per-trial seeds
+    from. Code generated under trial_random(trial_seed(...)) is then the
+    same on every run with this value, whatever the thread scheduling.
+    """
+    global _SEED
+    _SEED = value
+    random.seed(value)
+    _RNG.bit_generator.state = np.random.default_rng(random.getrandbits(64)).bit_generator.state
+    _RAND.reset(_RNG, random)
+
+def trial_seed(*key):
+    """64-bit seed for one trial, from the seed() value and the trial key (ints and strings)."""
+    digest = hashlib.blake2b(repr((_SEED,) + key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+@contextmanager
+def trial_random(trial_seed_value):
+    """
+    Within the block, the calling thread draws only from a NumPy Generator
+    and a random.Random seeded with trial_seed_value, so concurrent trials
+    never interleave their draws. None leaves the current generators in place.
+    """
+    if trial_seed_value is None:
+        yield
+        return
+    saved = dict(_RAND.__dict__)
+    _RAND.reset(np.random.default_rng(trial_seed_value), random.Random(trial_seed_value))
+    try:
+        yield
+    finally:
+        _RAND.__dict__.update(saved)
+
+# Above this edge probability the random DAG is drawn as one dense mask;
+# below it, edge slots are skipped with geometric gaps.
+_DENSE_CONNECTIVITY = 0.3
 
 # List of supported data types that can be used for transformations
 # These types will be randomly assigned to function inputs and outputs
-DATA_TYPES = [
+DATA_TYPES = (
     "int", "float", "list", "dict", "tuple", 
     "set", "str", "complex", "bool"
-]
+)
 
 # Dictionary mapping pairs of types (input_type, output_type) to possible transformation code snippets
 # Each entry provides one or more code snippets that convert a variable named 'parameter' 
@@ -130,24 +224,10 @@ TRANSFORMATIONS_MAP = {
 }
 
 
-def get_random_transformation_code(input_type, output_type):
+def _fallback_transformation_code(input_type, output_type):
     """
-    Return a code snippet that transforms a variable named 'parameter' from 'input_type' 
-    to a variable named 'result' of 'output_type'. If no direct mapping is found in
-    TRANSFORMATIONS_MAP, generate a fallback snippet.
-    
-    Args:
-        input_type (str): The source data type (must be one of DATA_TYPES)
-        output_type (str): The target data type (must be one of DATA_TYPES)
-        
-    Returns:
-        str: A Python code snippet that transforms 'parameter' to 'result' with appropriate types
+    Snippet used when TRANSFORMATIONS_MAP has no entry for (input_type, output_type).
     """
-    key = (input_type, output_type)
-    if key in TRANSFORMATIONS_MAP:
-        return random.choice(TRANSFORMATIONS_MAP[key])
-
-    # Fallback logic if no direct match is in TRANSFORMATIONS_MAP:
     if input_type == "bool":
         if output_type == "dict":
             return "result = {'was_true': parameter}"
@@ -183,6 +263,55 @@ def get_random_transformation_code(input_type, output_type):
     return "result = None  # fallback default"
 
 
+# TRANSFORMATIONS_MAP flattened for lookup: singleton entries (most of them)
+# are stored as the bare string so they need no random draw at all. Every
+# other DATA_TYPES pair gets its (fixed) fallback snippet precomputed here.
+_TRANSFORMATION_CHOICES = {
+    (input_type, output_type): _fallback_transformation_code(input_type, output_type)
+    for input_type in DATA_TYPES
+    for output_type in DATA_TYPES
+}
+_TRANSFORMATION_CHOICES.update(
+    (key, snippets[0] if len(snippets) == 1 else tuple(snippets))
+    for key, snippets in TRANSFORMATIONS_MAP.items()
+)
+
+
+def get_random_transformation_code(input_type, output_type):
+    """
+    Return a code snippet that transforms a variable named 'parameter' from 'input_type' 
+    to a variable named 'result' of 'output_type'. If no direct mapping is found in
+    TRANSFORMATIONS_MAP, generate a fallback snippet.
+    
+    Args:
+        input_type (str): The source data type (must be one of DATA_TYPES)
+        output_type (str): The target data type (must be one of DATA_TYPES)
+        
+    Returns:
+        str: A Python code snippet that transforms 'parameter' to 'result' with appropriate types
+    """
+    entry = _TRANSFORMATION_CHOICES.get((input_type, output_type))
+    if entry is None:
+        return _fallback_transformation_code(input_type, output_type)
+    return entry if entry.__class__ is str else _RAND.py.choice(entry)
+
+
+# Types whose literal never varies, and generators for the ones that do
+_FIXED_LITERALS = {
+    "list": "[1, 2, 3]",
+    "dict": "{'key': 42}",
+    "tuple": "(10, 20)",
+    "set": "{1, 2, 3}",
+    "complex": "complex(3, 4)",
+}
+_RANDOM_LITERALS = {
+    "int": lambda: str(_RAND.randint(1, 20)),
+    "float": lambda: f"{10 * _RAND.random():.2f}",
+    "str": lambda: f"'{_RAND.letters(5)}'",
+    "bool": lambda: "True" if _RAND.random() < 0.5 else "False",
+}
+
+
 def generate_random_literal(data_type):
     """
     Return a small literal in Python syntax consistent with 'data_type'.
@@ -193,27 +322,11 @@ def generate_random_literal(data_type):
     Returns:
         str: A string representation of a literal value matching the requested type
     """
-    if data_type == "int":
-        return str(random.randint(1, 20))
-    elif data_type == "float":
-        return f"{random.uniform(0, 10):.2f}"
-    elif data_type == "list":
-        return "[1, 2, 3]"
-    elif data_type == "dict":
-        return "{'key': 42}"
-    elif data_type == "tuple":
-        return "(10, 20)"
-    elif data_type == "set":
-        return "{1, 2, 3}"
-    elif data_type == "str":
-        random_string_content = ''.join(random.choice(string.ascii_lowercase) for _ in range(5))
-        return f"'{random_string_content}'"
-    elif data_type == "complex":
-        return "complex(3, 4)"
-    elif data_type == "bool":
-        return "True" if random.random() < 0.5 else "False"
-    else:
-        return "None"
+    literal = _FIXED_LITERALS.get(data_type)
+    if literal is not None:
+        return literal
+    generator = _RANDOM_LITERALS.get(data_type)
+    return generator() if generator is not None else "None"
 
 
 def generate_random_string(length=5):
@@ -226,7 +339,7 @@ def generate_random_string(length=5):
     Returns:
         str: A random string of lowercase letters
     """
-    return ''.join(random.choice(string.ascii_lowercase) for _ in range(length))
+    return _RAND.letters(length)
 
 
 def generate_random_filler_lines(count_lines):
@@ -243,7 +356,7 @@ def generate_random_filler_lines(count_lines):
     lines = []
     for _ in range(count_lines):
         variable_name = generate_random_string()
-        random_value = random.randint(1, 100)
+        random_value = _RAND.randint(1, 100)
         lines.append(f"{variable_name} = {random_value}")
     return lines
 
@@ -261,7 +374,7 @@ def generate_branching_code_snippet(number_of_branches):
     lines = []
     for _ in range(number_of_branches):
         variable_name = generate_random_string()
-        lines.append(f"if {random.randint(0, 10)} > 5:")
+        lines.append(f"if {_RAND.randint(0, 10)} > 5:")
         lines.append(f"    {variable_name} = '{generate_random_string()}'")
         lines.append("else:")
         lines.append(f"    {variable_name} = '{generate_random_string()}'")
@@ -281,7 +394,7 @@ def generate_loop_code_snippet(number_of_loops):
     lines = []
     for _ in range(number_of_loops):
         loop_variable = generate_random_string()
-        lines.append(f"for {loop_variable} in range({random.randint(1, 5)}):")
+        lines.append(f"for {loop_variable} in range({_RAND.randint(1, 5)}):")
         lines.append("    pass  # loop placeholder")
     return lines
 
@@ -362,6 +475,26 @@ def generate_method_body(
     return lines
 
 
+def _indent_block(lines, indent):
+    """
+    Join lines into one block with every line prefixed by 'indent'. The
+    prefix rides on the separator, so this is a single join instead of one
+    new string per line.
+    """
+    return indent + ("\n" + indent).join(lines)
+
+
+# Fixed skeleton of every generated class; only the name and method bodies vary
+_CLASS_TEMPLATE = (
+    "class {name}:\n"
+    "    def __init__(self):\n"
+    "        pass  # minimal constructor\n"
+    "    def run(self, parameter):\n"
+    "{run_body}\n"
+)
+_METHOD_TEMPLATE = "    def method_{index}(self, parameter):\n{body}\n"
+
+
 def build_adjacency_list(number_of_objects, topology_mode, connectivity):
     """
     Build an adjacency list (parents-only form) ignoring data types:
@@ -413,42 +546,70 @@ def build_adjacency_list(number_of_objects, topology_mode, connectivity):
 
             # Dynamically connect nodes to the final node
             final_node = number_of_objects - 1
-            if 1 not in adjacency_list[final_node]:
-                adjacency_list[final_node].append(1)
-            if 2 not in adjacency_list[final_node]:
-                adjacency_list[final_node].append(2)
+            final_parents = set(adjacency_list[final_node])
+            for index in (1, 2):
+                if index not in final_parents:
+                    final_parents.add(index)
+                    adjacency_list[final_node].append(index)
 
             # Connect all remaining nodes to at least one parent
             for index in range(3, number_of_objects - 1):
-                parent = random.randint(0, index - 1)  # Randomly choose a parent from earlier nodes
+                parent = _RAND.py.randint(0, index - 1)  # Randomly choose a parent from earlier nodes
                 adjacency_list[index].append(parent)
 
             # Ensure all nodes connect to the final node
             for index in range(number_of_objects - 1):
-                if index not in adjacency_list[final_node]:
+                if index not in final_parents:
+                    final_parents.add(index)
                     adjacency_list[final_node].append(index)
 
     else:
-        # "random": guaranteed DAG by generating a random topological order first.
-        all_nodes = list(range(number_of_objects))
-        random.shuffle(all_nodes)
-        position = {}
-        for idx, node_id in enumerate(all_nodes):
-            position[node_id] = idx
-
-        # For each ordered pair (u, v), if position[u] < position[v], 
-        # add edge u->v with probability = connectivity
-        for u in range(number_of_objects):
-            for v in range(number_of_objects):
-                if u == v:
-                    continue
-                if position[u] < position[v]:
-                    if random.random() < connectivity:
-                        adjacency_list[v].append(u)
+        # "random": guaranteed DAG by generating a random topological order first,
+        # then adding u->v with probability = connectivity for every pair whose
+        # positions satisfy position[u] < position[v].
+        all_nodes = _RAND.rng.permutation(number_of_objects)
+        first, second = _sample_ordered_pairs(number_of_objects, connectivity)
+        parents, children = all_nodes[first], all_nodes[second]
+
+        # parents of each node in ascending index order, as the pairwise loop produced
+        order = np.lexsort((parents, children))
+        for u, v in zip(parents[order].tolist(), children[order].tolist()):
+            adjacency_list[v].append(u)
 
     return adjacency_list
 
 
+def _sample_ordered_pairs(n, p):
+    """
+    Keep each position pair (i, j) with i < j < n independently with
+    probability p. Returns the kept pairs as two index arrays (i, j).
+
+    Dense p uses a single upper-triangular mask. Sparse p walks the
+    n*(n-1)/2 pair slots with geometric gaps, so only the ~p*n*(n-1)/2 kept
+    slots are ever drawn; a slot index k maps back to j = (1 + isqrt(1+8k))//2,
+    i = k - j*(j-1)/2.
+    """
+    slots = n * (n - 1) // 2
+    if slots == 0 or p <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    if p > _DENSE_CONNECTIVITY:
+        return np.nonzero(np.triu(_RAND.rng.random((n, n)) < p, k=1))
+
+    expected = slots * p
+    ks = np.cumsum(_RAND.rng.geometric(p, size=int(expected + 5 * math.sqrt(expected)) + 16)) - 1
+    while ks[-1] < slots:                # rare: the first batch fell short
+        more = np.cumsum(_RAND.rng.geometric(p, size=ks.size)) + ks[-1]
+        ks = np.concatenate((ks, more))
+    ks = ks[ks < slots]
+
+    j = ((1 + np.sqrt(1 + 8 * ks.astype(np.float64))) // 2).astype(np.int64)
+    j -= j * (j - 1) // 2 > ks           # undo float rounding at slot boundaries
+    j += (j + 1) * j // 2 <= ks
+    i = ks - j * (j - 1) // 2
+    return i, j
+
+
 def remove_cycles_and_get_topological_order(adjacency_list):
     """
     Perform a Kahn's algorithm for topological sorting. If any nodes remain 
@@ -463,6 +624,26 @@ def remove_cycles_and_get_topological_order(adjacency_list):
              (A valid execution order for the dependency graph)
     """
     number_of_objects = len(adjacency_list)
+    topological_order = _kahn_lists(adjacency_list)
+
+    if len(topological_order) == number_of_objects:
+        return topological_order
+
+    # If some remain out of the topological_order, forcibly remove edges
+    visited = [False] * number_of_objects
+    for node_index in topological_order:
+        visited[node_index] = True
+    for stuck_node, seen in enumerate(visited):
+        if not seen:
+            adjacency_list[stuck_node].clear()
+            topological_order.append(stuck_node)
+
+    return topological_order
+
+
+def _kahn_lists(adjacency_list):
+    """Pure-Python Kahn's algorithm; returns the nodes that reached in_degree 0."""
+    number_of_objects = len(adjacency_list)
     children_list = [[] for _ in range(number_of_objects)]
     in_degree = [0] * number_of_objects
 
@@ -485,18 +666,10 @@ def remove_cycles_and_get_topological_order(adjacency_list):
             in_degree[child_of_node] -= 1
             if in_degree[child_of_node] == 0:
                 queue.append(child_of_node)
-
-    # If some remain out of the topological_order, forcibly remove edges
-    remaining = set(range(number_of_objects)) - set(topological_order)
-    while remaining:
-        stuck_node = remaining.pop()
-        adjacency_list[stuck_node].clear()
-        topological_order.append(stuck_node)
-
     return topological_order
 
 
-def unify_types_based_on_adjacency(node_list, adjacency_list):
+def unify_types_based_on_adjacency(node_list, adjacency_list, topological_order=None):
     """
     For each node i, ensure that all parents' output_type == i's input_type.
     If multiple parents have conflicting output_types, pick one parent's output_type at random 
@@ -508,34 +681,54 @@ def unify_types_based_on_adjacency(node_list, adjacency_list):
     Args:
         node_list (list): List of (object_name, object_type, input_type, output_type) tuples
         adjacency_list (list): Adjacency list where adjacency_list[i] lists parents of i
+        topological_order (list, optional): An order already computed for this
+            adjacency_list by remove_cycles_and_get_topological_order; computed
+            here if not given
         
     Modifies:
         node_list: Updates input_type and output_type for each object to ensure type compatibility
         adjacency_list: May remove edges to resolve type conflicts
+
+    Returns:
+        list: The topological order used. Removing edges never invalidates a
+             topological order, so it still holds for the pruned adjacency_list.
     """
-    topological_order = remove_cycles_and_get_topological_order(adjacency_list)
+    if topological_order is None:
+        topological_order = remove_cycles_and_get_topological_order(adjacency_list)
 
-    for node_index in topological_order:
+    # The parent scan below only reads output types, so keep them as their own
+    # flat column instead of indexing into each node tuple.
+    output_types = [node[3] for node in node_list]
+
+    # One batched draw for every root input type and every output type
+    input_draws, output_draws = _RAND.rng.integers(0, len(DATA_TYPES), size=(2, len(topological_order))).tolist()
+
+    for position, node_index in enumerate(topological_order):
         parents = adjacency_list[node_index]
         if len(parents) == 0:
-            input_type = random.choice(DATA_TYPES)
+            input_type = DATA_TYPES[input_draws[position]]
         else:
-            parent_output_types = [node_list[parent_index][3] for parent_index in parents]
+            parent_output_types = [output_types[parent_index] for parent_index in parents]
             unique_output_types = set(parent_output_types)
             if len(unique_output_types) == 1:
                 input_type = unique_output_types.pop()
             else:
-                chosen_type = random.choice(parent_output_types)
+                chosen_type = _RAND.py.choice(parent_output_types)
                 input_type = chosen_type
-                # Remove edges from parents that do not match the chosen type
-                for parent_index in list(parents):
-                    if node_list[parent_index][3] != chosen_type:
-                        parents.remove(parent_index)
+                # Keep only the parents whose output matches the chosen type
+                adjacency_list[node_index] = [
+                    parent_index
+                    for parent_index, output_type in zip(parents, parent_output_types)
+                    if output_type == chosen_type
+                ]
 
         object_name, object_type, _, _ = node_list[node_index]
-        output_type = random.choice(DATA_TYPES)
+        output_type = DATA_TYPES[output_draws[position]]
+        output_types[node_index] = output_type
         node_list[node_index] = (object_name, object_type, input_type, output_type)
 
+    return topological_order
+
 
 def generate_codebase(
     num_objects=5,
@@ -560,14 +753,14 @@ def generate_codebase(
     # 1) Build a parent-based adjacency list ignoring data types
     adjacency_list = build_adjacency_list(num_objects, topology_mode, connectivity)
 
-    # 2) Possibly remove cycles if any exist
-    remove_cycles_and_get_topological_order(adjacency_list)
+    # 2) Possibly remove cycles if any exist (step 3 names nodes after their parents)
+    topological_order = remove_cycles_and_get_topological_order(adjacency_list)
 
     # 3) Create placeholders for node definitions
-    node_list = []
-    for index in range(num_objects):
-        chosen_type = random.choice(["function", "class"])
-        if use_semantics:
+    object_types = _RAND.py.choices(("function", "class"), k=num_objects)
+    if use_semantics:
+        node_list = []
+        for index, chosen_type in enumerate(object_types):
             parents = adjacency_list[index]
             if not parents:
                 suffix = "start"
@@ -576,21 +769,25 @@ def generate_codebase(
             else:
                 suffix = "_".join(str(p) for p in sorted(parents))
                 suffix = f"merge_{suffix}"
-            chosen_name = f"{'function' if chosen_type == 'function' else 'class'}_{suffix}"
-        else:
-            chosen_name = f"{chosen_type.capitalize()}_{index}"
-        node_list.append((chosen_name, chosen_type, None, None))
+            node_list.append((f"{chosen_type}_{suffix}", chosen_type, None, None))
+    else:
+        node_list = [
+            (("Function_" if chosen_type == "function" else "Class_") + str(index), chosen_type, None, None)
+            for index, chosen_type in enumerate(object_types)
+        ]
 
-    # 4) Unify the data types based on adjacency
-    unify_types_based_on_adjacency(node_list, adjacency_list)
+    # 4) Unify the data types based on adjacency (the graph is unchanged since step 2)
+    topological_order = unify_types_based_on_adjacency(node_list, adjacency_list, topological_order)
 
-    # 5) Generate code objects in a final topological order
-    topological_order = remove_cycles_and_get_topological_order(adjacency_list)
-    code_sections = []
+    # 5) Generate code objects in a final topological order; step 4 only drops
+    #    edges, so its order is still valid
+    out = io.StringIO()
 
-    # Build the actual function/class definitions
+    # Build the actual function/class definitions, one blank line apart
     for index, (object_name, object_type, input_type, output_type) in enumerate(node_list):
-        estimated_lines = max(1, int(random.gauss(avg_length, avg_length * 0.2)))
+        estimated_lines = max(1, int(_RAND.py.gauss(avg_length, avg_length * 0.2)))
+        if index:
+            out.write("\n")
 
         if object_type == "function":
             header = f"def {object_name}(parameter):"
@@ -607,22 +804,14 @@ def generate_codebase(
                 adjacency_list=adjacency_list,
                 use_comments=use_comments
             )
-            indented_body = "\n".join("    " + line for line in body_lines)
-            code_definition = header + "\n" + indented_body + "\n"
-            code_sections.append(code_definition)
+            indented_body = _indent_block(body_lines, "    ")
+            out.write(header)
+            out.write("\n")
+            out.write(indented_body)
+            out.write("\n")
 
         else:
-            # Class
-            class_header = f"class {object_name}:"
-            class_lines = []
-
-            init_header = "    def __init__(self):"
-            init_body = ["pass  # minimal constructor"]
-            class_lines.append(init_header)
-            class_lines.extend("        " + line for line in init_body)
-
-            # Primary run() method
-            run_header = "    def run(self, parameter):"
+            # Class: constructor and primary run() method
             filler_for_run = max(0, estimated_lines // 2 - branching_factor - loop_factor)
             run_body_lines = generate_method_body(
                 input_type,
@@ -636,16 +825,16 @@ def generate_codebase(
                 adjacency_list=adjacency_list,
                 use_comments=use_comments
             )
-            run_body_lines = ["        " + line for line in run_body_lines]
-            class_lines.append(run_header)
-            class_lines.extend(run_body_lines)
+            out.write(_CLASS_TEMPLATE.format_map({
+                "name": object_name,
+                "run_body": _indent_block(run_body_lines, "        "),
+            }))
 
             # Extra methods for realism
-            number_of_extra_methods = random.randint(1, 3)
+            number_of_extra_methods = _RAND.py.randint(1, 3)
             for extra_method_index in range(number_of_extra_methods):
-                extra_input_type = random.choice(DATA_TYPES)
-                extra_output_type = random.choice(DATA_TYPES)
-                extra_method_header = f"    def method_{extra_method_index}(self, parameter):"
+                extra_input_type = _RAND.py.choice(DATA_TYPES)
+                extra_output_type = _RAND.py.choice(DATA_TYPES)
                 filler_for_extra = max(0, estimated_lines // 3 - branching_factor - loop_factor)
                 extra_method_body_lines = generate_method_body(
                     extra_input_type,
@@ -659,19 +848,16 @@ def generate_codebase(
                     adjacency_list=adjacency_list,
                     use_comments=use_comments
                 )
-                extra_method_body_lines = ["        " + line for line in extra_method_body_lines]
-                class_lines.append(extra_method_header)
-                class_lines.extend(extra_method_body_lines)
-
-            class_definition = class_header + "\n" + "\n".join(class_lines) + "\n"
-            code_sections.append(class_definition)
+                out.write(_METHOD_TEMPLATE.format_map({
+                    "index": extra_method_index,
+                    "body": _indent_block(extra_method_body_lines, "        "),
+                }))
 
     # Build the main() function that runs in topological order
-    main_lines = [
-        "def main():",
-        "    import math, cmath, random",
-        "    results = {}",
-    ]
+    # (every line below is written with its leading newline)
+    out.write("\ndef main():")
+    out.write("\n    import math, cmath, random")
+    out.write("\n    results = {}")
     for node_index in topological_order:
         object_name, object_type, input_type, output_type = node_list[node_index]
         parents = adjacency_list[node_index]
@@ -679,47 +865,50 @@ def generate_codebase(
         if not parents:
             # No parents => generate a random literal for input_type
             literal_value = generate_random_literal(input_type)
-            main_lines.append(f"    parameter_value = {literal_value}  # object {node_index} input")
+            out.write(f"\n    parameter_value = {literal_value}  # object {node_index} input")
         else:
             # Use the first parent's output
             first_parent = parents[0]
-            main_lines.append(f"    parameter_value = results[{first_parent}]  # from first parent")
+            out.write(f"\n    parameter_value = results[{first_parent}]  # from first parent")
 
         if object_type == "function":
-            main_lines.append(f"    output_value = {object_name}(parameter_value)")
+            out.write(f"\n    output_value = {object_name}(parameter_value)")
         else:
             instance_variable_name = f"instance_{node_index}"
-            main_lines.append(f"    {instance_variable_name} = {object_name}()")
-            main_lines.append(f"    output_value = {instance_variable_name}.run(parameter_value)")
+            out.write(f"\n    {instance_variable_name} = {object_name}()")
+            out.write(f"\n    output_value = {instance_variable_name}.run(parameter_value)")
 
-        main_lines.append(f"    results[{node_index}] = output_value")
-        main_lines.append("")
+        out.write(f"\n    results[{node_index}] = output_value")
+        out.write("\n")
 
-    main_lines.append("    print('Execution complete. Results:')")
-    main_lines.append("    for key, value in results.items():")
-    main_lines.append("        print(f'Object {key} output = {value}')")
+    out.write("\n    print('Execution complete. Results:')")
+    out.write("\n    for key, value in results.items():")
+    out.write("\n        print(f'Object {key} output = {value}')")
 
-    main_function_code = "\n".join(main_lines)
     entry_point_code = """\
     if __name__ == "__main__":
         main()
     """
+    out.write("\n")
+    out.write(entry_point_code)
 
-    complete_code = "\n".join(code_sections) + "\n" + main_function_code + "\n" + entry_point_code
-    return complete_code, node_list, adjacency_list
+    return out.getvalue(), node_list, adjacency_list
 
-def generate_code_from_nodes(node_list, adjacency_list, use_comments=False):
+def generate_code_from_nodes(node_list, adjacency_list, use_comments=False, seed=None):
     """
     Regenerate the Python code based on node list and adjacency.
-    Used after mutation.
+    Used after mutation. With a seed (from trial_seed), the code only
+    depends on it and the arguments.
     """
-    from gen import generate_method_body, generate_random_literal  # make sure these are importable
+    with trial_random(seed):
+        return _code_from_nodes(node_list, adjacency_list, use_comments)
 
+def _code_from_nodes(node_list, adjacency_list, use_comments):
     code_sections = []
     topological_order = remove_cycles_and_get_topological_order(adjacency_list)
 
     for index, (object_name, object_type, input_type, output_type) in enumerate(node_list):
-        estimated_lines = random.randint(5, 10)
+        estimated_lines = _RAND.py.randint(5, 10)
 
         if object_type == "function":
             header = f"def {object_name}(parameter):"
@@ -735,7 +924,7 @@ def generate_code_from_nodes(node_list, adjacency_list, use_comments=False):
                 adjacency_list=adjacency_list,
                 use_comments=use_comments
             )
-            indented = "\n".join("    " + line for line in body_lines)
+            indented = _indent_block(body_lines, "    ")
             code_sections.append(header + "\n" + indented + "\n")
 
         else:
@@ -758,8 +947,7 @@ def generate_code_from_nodes(node_list, adjacency_list, use_comments=False):
                 adjacency_list=adjacency_list,
                 use_comments=use_comments
             )
-            run_body = ["        " + line for line in run_body]
-            class_lines.extend(run_body)
+            class_lines.append(_indent_block(run_body, "        "))
 
             code_sections.append("\n".join(class_lines) + "\n")
 
@@ -1,3 +1,15 @@
+from operator import itemgetter
+
+_edge_ends = itemgetter("from", "to")
+
+def _edge_pairs(edges):
+    """(from, to) of every well-formed edge dict; malformed edges are skipped."""
+    for edge in edges:
+        try:
+            yield _edge_ends(edge)
+        except (KeyError, TypeError):
+            pass
+
 def _normalise_adj(adj_block):
     """
     Accepts the two formats the LLM (or your extractor) might return:
@@ -8,11 +20,7 @@ def _normalise_adj(adj_block):
     Returns a list of (parent, child) tuples.
     """
     if isinstance(adj_block, list):
-        return [
-            (edge.get("from"), edge.get("to"))
-            for edge in adj_block
-            if "from" in edge and "to" in edge
-        ]
+        return list(_edge_pairs(adj_block))
 
     if isinstance(adj_block, dict):
         return list(zip(adj_block.get("from", []), adj_block.get("to", [])))
@@ -23,6 +31,33 @@ def _without_main(pairs):
     """Return all (parent, child) tuples that do *not* mention 'main'."""
     return [(p, c) for (p, c) in pairs if p != "main" and c != "main"]
 
+def _adj_pairs(adj_block):
+    """
+    _without_main(_normalise_adj(adj_block)) fused into one lazy pass:
+    yields the (parent, child) pairs that do not mention 'main', with no
+    intermediate lists.
+    """
+    if isinstance(adj_block, list):
+        pairs = _edge_pairs(adj_block)
+    elif isinstance(adj_block, dict):
+        pairs = zip(adj_block.get("from", []), adj_block.get("to", []))
+    else:
+        return
+    for p, c in pairs:
+        if p != "main" and c != "main":
+            yield p, c
+
+def pair_set(froms, tos):
+    """
+    frozenset of the (parent, child) pairs in a {"from", "to"} adjacency,
+    'main' edges dropped.
+    """
+    return frozenset(_without_main(zip(froms, tos)))
+
+def same_edge_set(gold_pairs, pred_pairs):
+    """Set equality of two (parent, child) pair collections."""
+    return set(gold_pairs) == set(pred_pairs)
+
 def flip_adjacency(edge_dict: dict[str, list[str]]) -> dict[str, list[str]]:
     """
     Return a new adjacency dict whose 'from' and 'to' lists are swapped,
@@ -38,24 +73,39 @@ def flip_adjacency(edge_dict: dict[str, list[str]]) -> dict[str, list[str]]:
     {"from": list, "to": list}
         A copy with parent/child directions reversed.
     """
-    if not edge_dict or "from" not in edge_dict or "to" not in edge_dict:
+    src, dst = _edge_columns(edge_dict)
+    if src is None:
         raise ValueError("adjacency must have 'from' and 'to' lists")
 
-    if len(edge_dict["from"]) != len(edge_dict["to"]):
+    if len(src) != len(dst):
         raise ValueError("'from' and 'to' lists are different lengths")
 
     return {
-        "from": edge_dict["to"][:],   # shallow-copy
-        "to":   edge_dict["from"][:]
+        "from": list(dst),   # shallow-copy
+        "to":   list(src)
     }
 
+def _edge_columns(edge_dict):
+    """
+    The 'from' and 'to' lists of an adjacency dict, or (None, None) when the
+    LLM returned anything else (a list of edges, a string, missing keys,
+    non-list columns).
+    """
+    if not isinstance(edge_dict, dict):
+        return None, None
+    src, dst = edge_dict.get("from"), edge_dict.get("to")
+    if not isinstance(src, (list, tuple)) or not isinstance(dst, (list, tuple)):
+        return None, None
+    return src, dst
+
 def safe_flip(edge_dict):
     """Flip 'from' and 'to'.  If the lists are different lengths, truncate the
     longer one so the operation never throws."""
-    if not edge_dict or "from" not in edge_dict or "to" not in edge_dict:
+    src, dst = _edge_columns(edge_dict)
+    if src is None:
         return {"from": [], "to": []}          # or raise
-    m = min(len(edge_dict["from"]), len(edge_dict["to"]))
-    return {"from": edge_dict["to"][:m], "to": edge_dict["from"][:m]}
+    m = len(src) if len(src) < len(dst) else len(dst)
+    return {"from": dst[:m], "to": src[:m]}
 
 def compute_match_percentage(gold_pairs, llm_pairs):
     if not gold_pairs:
@@ -1,76 +1,374 @@
 import os
 import json
+import atexit
+import logging
+import asyncio
+import hashlib
+import random
+import shelve
+import time
+import httpx
+import openai
+import groq
+import anthropic
 from openai import OpenAI
 from groq import Groq
 from anthropic import Anthropic
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 
+try:                                # HTTP/2 needs the optional h2 package (httpx[http2])
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = ".llm_cache"   # shelve file holding replies keyed by request hash
+LLM_CACHE_TTL = 7 * 86400       # seconds before a cached reply is fetched again
+_response_cache = None
+CACHE_STATS = {"hits": 0, "misses": 0}   # response-cache lookups this process
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))   # per provider
+MAX_ATTEMPTS = 5                # tries per request on rate limits and transient errors
+
+# Worth retrying: rate limits, timeouts, dropped connections and 5xx replies
+_TRANSIENT_ERRORS = tuple(
+    getattr(sdk, name)
+    for sdk in (openai, groq, anthropic)
+    for name in ("RateLimitError", "APIConnectionError", "InternalServerError")
+) + (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+)
+
+# Keep-alive pool of the OpenAI/Groq clients; sized for run_topology_experiments'
+# concurrency so parallel requests reuse warm TLS connections. The SDKs
+# still set their own timeouts on every request.
+_HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=50)
+
+def _http_client():
+    return httpx.Client(http2=_HTTP2, limits=_HTTP_LIMITS, follow_redirects=True)
+
+def _setup_gemini(api_key):
+    genai.configure(api_key=api_key)
+    return genai
+
+# provider -> (API key variable, client factory taking that key)
+_PROVIDER_SETUP = {
+    "openai":    ("OPENAI_API_KEY",    lambda api_key: OpenAI(api_key=api_key, http_client=_http_client())),
+    "groq":      ("GROQ_API_KEY",      lambda api_key: Groq(api_key=api_key, http_client=_http_client())),
+    "anthropic": ("ANTHROPIC_API_KEY", lambda api_key: Anthropic(api_key=api_key)),
+    "gemini":    ("GEMINI_API_KEY",    _setup_gemini),
+}
+
 def setup_client(provider="openai"):
-    if provider == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise EnvironmentError("Missing OPENAI_API_KEY")
-        return OpenAI(api_key=api_key)
-    elif provider == "groq":
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise EnvironmentError("Missing GROQ_API_KEY")
-        return Groq(api_key=api_key)
-    elif provider == "anthropic":
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise EnvironmentError("Missing ANTHROPIC_API_KEY")
-        return Anthropic(api_key=api_key)
-    elif provider == "gemini":
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise EnvironmentError("Missing GEMINI_API_KEY")
-        genai.configure(api_key=api_key)
-        return genai
-    else:
-        raise ValueError(f"Unsupported provider: {provider}")
+    try:
+        key_var, factory = _PROVIDER_SETUP[provider]
+    except KeyError:
+        raise ValueError(f"Unsupported provider: {provider}") from None
+    api_key = os.getenv(key_var)
+    if not api_key:
+        raise EnvironmentError(f"Missing {key_var}")
+    return factory(api_key)
 
-def send_message(client, provider, messages, model):
-    print("\n===== SENDING MESSAGE TO LLM =====")
-    print("Model:", model)
-    print("Provider:", provider)
-    print("Messages:", json.dumps(messages, indent=2))
-    print("===================================")
+def setup_client_pool(model_map, concurrency=4):
+    """
+    One ClientPool over several providers, given as {provider: model}.
+    """
+    return ClientPool([(provider, setup_client(provider), model) for provider, model in model_map.items()], concurrency)
+
+class TokenBucket:
+    """
+    Token bucket holding up to 'capacity' tokens, refilled at 'rate' tokens
+    per second; acquire() waits for a token. It keeps no asyncio state, so
+    one bucket can serve every event loop the run creates.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+_rate_limits = {}               # provider -> TokenBucket
+
+def _rate_limit(provider):
+    bucket = _rate_limits.get(provider)
+    if bucket is None:
+        rate = LLM_REQUESTS_PER_MINUTE / 60
+        bucket = _rate_limits[provider] = TokenBucket(rate, capacity=max(1, rate * 5))
+    return bucket
+
+class ClientPool:
+    """
+    Several (provider, client, model) endpoints used as one client: each
+    request goes to the least busy endpoint with a free slot (at most
+    'concurrency' in flight per endpoint). Each endpoint attempt goes
+    through the provider's rate limit and transient-error retries
+    (_send_with_retry); a request that still fails is tried once on each of
+    the other endpoints before the last error is raised. Pass it as the
+    client to send_message_async; its provider and model arguments are then
+    only used for the cache key.
+    """
+
+    def __init__(self, endpoints, concurrency=4):
+        self.endpoints = list(endpoints)
+        self.concurrency = concurrency
+        self._loop = None
+
+    def _bind(self):
+        # asyncio primitives belong to one event loop, and every sweep run
+        # through asyncio.run gets a fresh one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._ready = asyncio.Condition()
+            self._busy = [0] * len(self.endpoints)
+
+    def _least_busy(self, tried):
+        free = [i for i in range(len(self.endpoints)) if i not in tried and self._busy[i] < self.concurrency]
+        return min(free, key=self._busy.__getitem__, default=None)
+
+    async def send(self, messages):
+        self._bind()
+        tried = set()
+        error = None
+        while len(tried) < len(self.endpoints):
+            async with self._ready:
+                await self._ready.wait_for(lambda: self._least_busy(tried) is not None)
+                index = self._least_busy(tried)
+                self._busy[index] += 1
+            tried.add(index)
+            provider, client, model = self.endpoints[index]
+            try:
+                return await _send_with_retry(client, provider, messages, model)
+            except Exception as e:
+                error = e
+            finally:
+                async with self._ready:
+                    self._busy[index] -= 1
+                    self._ready.notify_all()
+        raise error
+
+def _read_json_stream(pieces):
+    """
+    Join streamed text pieces into the first top-level JSON object, stopping
+    as soon as one closes and parses so trailing chatter is never waited
+    for, and dropping any prose or code fence before it. A '{' in the prose
+    starts a candidate too; if that candidate closes but is not valid JSON,
+    or is still open when the stream ends (e.g. an unbalanced quote), the
+    scan restarts just after its '{'. Text with no parseable object is
+    returned whole.
+    """
+    pieces = iter(pieces)
+    end = object()              # a piece may itself be None (empty role/finish deltas)
+    text = ""
+    pos, start = 0, -1          # next index to scan / the candidate's '{' (-1: none)
+    depth, in_str, escaped = 0, False, False
+    while True:
+        if pos == len(text):
+            piece = next(pieces, end)
+            if piece is not end:
+                text += piece or ""
+                continue
+            if start < 0:
+                return text
+            pos, start, depth, in_str = start + 1, -1, 0, False
+            continue
+        ch = text[pos]
+        pos += 1
+        if start < 0:
+            if ch == "{":
+                start, depth, in_str, escaped = pos - 1, 1, False, False
+        elif in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if not depth:
+                candidate = text[start:pos]
+                try:
+                    json.loads(candidate)
+                    return candidate
+                except ValueError:
+                    pos, start = start + 1, -1
 
+def _anthropic_payload(messages):
+    """
+    Split OpenAI-style messages into Anthropic's (system, messages) form.
+    The system prompt and the first user turn (the static structured prompt)
+    carry cache_control breakpoints so the provider can reuse that prefix
+    across the experiment's calls.
+    """
+    system = [{"type": "text", "text": m["content"]} for m in messages if m["role"] == "system"]
+    turns = [{"role": m["role"], "content": m["content"]} for m in messages if m["role"] != "system"]
+    if system:
+        system[-1]["cache_control"] = {"type": "ephemeral"}
+    if turns and turns[0]["role"] == "user":
+        turns[0]["content"] = [
+            {"type": "text", "text": turns[0]["content"], "cache_control": {"type": "ephemeral"}}
+        ]
+    return system, turns
+
+def _preview(messages, limit=200):
+    """Messages with every content cut to 'limit' characters, for logging."""
+    return [
+        {**m, "content": m["content"][:limit] + "..." if len(m["content"]) > limit else m["content"]}
+        if isinstance(m.get("content"), str) else m
+        for m in messages
+    ]
+
+# Each _PROVIDER_SEND function returns (reply text, prompt tokens the provider
+# served from its prompt cache).
+
+def _send_chat_completions(client, messages, model):
+    # the stream is closed as soon as the JSON object does, before the final
+    # usage chunk, so no cached-token count is available here
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True)
     try:
-        if provider == "openai":
-            response = client.chat.completions.create(...)
-            content = response.choices[0].message.content
-
-        elif provider == "groq":
-            response = client.chat.completions.create(...)
-            content = response.choices[0].message.content
-
-        elif provider == "anthropic":
-            response = client.messages.create(
-                model=model,
-                messages=messages,
-                max_tokens=1024
-            )
-            content = response.content[0].text
-
-        elif provider == "gemini":
-            chat = client.GenerativeModel(model).start_chat()
-            prompt_text = "\n".join([m["content"] for m in messages if m["role"] == "user"])
-            response = chat.send_message(prompt_text)
-            content = response.text
-        else:
-            raise ValueError("Unknown provider")
-
-        content = response.choices[0].message.content
-        print("\n===== LLM RESPONSE =====")
-        print(content)
-        print("========================\n")
-        return content
-
-    except Exception as e:
-        print("\n[ERROR] LLM call failed:", str(e))
-        return "{}"  # return empty JSON to prevent crashing
+        return _read_json_stream(
+            chunk.choices[0].delta.content for chunk in stream if chunk.choices and chunk.choices[0].delta.content
+        ), 0
+    finally:
+        stream.close()
+
+def _send_anthropic(client, messages, model):
+    system, turns = _anthropic_payload(messages)
+    extra = {"system": system} if system else {}
+    with client.messages.stream(
+        model=model,
+        messages=turns,
+        max_tokens=1024,
+        **extra
+    ) as stream:
+        content = _read_json_stream(stream.text_stream)
+        # usage arrives with message_start, so it is known even though the
+        # stream is left as soon as the JSON object closes
+        usage = stream.current_message_snapshot.usage
+        return content, usage.cache_read_input_tokens or 0
+
+_gemini_models = {}             # model name -> GenerativeModel, built on first use
+
+def _send_gemini(client, messages, model):
+    generative_model = _gemini_models.get(model)
+    if generative_model is None:
+        generative_model = _gemini_models[model] = client.GenerativeModel(model)
+    prompt_text = "\n".join(m["content"] for m in messages if m["role"] == "user")
+    # a one-shot request on a fresh, empty chat is just generate_content
+    response = generative_model.generate_content(prompt_text, stream=True)
+    return _read_json_stream(chunk.text for chunk in response), 0
+
+_PROVIDER_SEND = {
+    "openai":    _send_chat_completions,
+    "groq":      _send_chat_completions,
+    "anthropic": _send_anthropic,
+    "gemini":    _send_gemini,
+}
+
+def send_message(client, provider, messages, model):
+    return _send(client, provider, messages, model)[0]
+
+def _send(client, provider, messages, model):
+    """send_message, returning (reply text, prompt tokens served from the provider's cache)."""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("sending %s/%s: %s", provider, model, _preview(messages))
+
+    send = _PROVIDER_SEND.get(provider)
+    if send is None:
+        raise ValueError("Unknown provider")
+    content, cached_tokens = send(client, messages, model)
+
+    logger.debug("response from %s/%s (%d cached prompt tokens): %s", provider, model, cached_tokens, content)
+    return content, cached_tokens
+
+def _get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = shelve.open(LLM_CACHE_PATH)
+        logger.warning("LLM response cache is ON (%s): cached replies are replayed instead of drawing new samples", LLM_CACHE_PATH)
+        atexit.register(_response_cache.close)
+    return _response_cache
+
+def _cache_key(provider, model, messages, trial=None):
+    payload = json.dumps([provider, model, messages, trial], sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+async def send_message_async(client, provider, messages, model, trial=None):
+    """
+    Awaitable send_message, returning (reply, cached_tokens): the prompt
+    tokens the provider served from its prompt cache (Anthropic only; 0
+    elsewhere). The blocking SDK call runs in a worker thread so several
+    requests can be in flight at once.
+
+    With LLM_CACHE_ENABLE=1, replies are also memoized on disk by (provider,
+    model, messages, trial) for LLM_CACHE_TTL seconds so re-runs skip the
+    API, and every reply served from the cache is logged as a warning; trial
+    is any JSON-serialisable id of the sample being drawn, so repeated trials
+    with identical prompts get independent replies. The shelve is only
+    touched from the event-loop thread; lookups are tallied in CACHE_STATS.
+    """
+    if os.getenv("LLM_CACHE_ENABLE") != "1":
+        return await _fetch(client, provider, messages, model)
+
+    key = _cache_key(provider, model, messages, trial)
+    cache = _get_response_cache()
+    entry = cache.get(key)
+    if isinstance(entry, tuple) and time.time() - entry[0] < LLM_CACHE_TTL:
+        CACHE_STATS["hits"] += 1
+        logger.warning("CACHED reply (not a new sample) for %s/%s, trial %s, fetched %.0fs ago", provider, model, trial, time.time() - entry[0])
+        return entry[1], 0
+
+    CACHE_STATS["misses"] += 1
+    content, cached_tokens = await _fetch(client, provider, messages, model)
+    cache[key] = (time.time(), content)
+    return content, cached_tokens
+
+async def _fetch(client, provider, messages, model):
+    """One API round-trip, spread over the endpoints if client is a ClientPool."""
+    if isinstance(client, ClientPool):
+        return await client.send(messages)
+    return await _send_with_retry(client, provider, messages, model)
+
+def _backoff_delay(attempt):
+    """Seconds to wait before retry number attempt + 1: capped exponential plus jitter."""
+    return min(60, 2 ** attempt) + random.random()
+
+async def _send_with_retry(client, provider, messages, model):
+    """
+    One _send under the provider's rate limit. Rate limits and
+    transient failures are retried with backoff up to MAX_ATTEMPTS tries;
+    the last error, or any other one, is raised to the caller.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        await _rate_limit(provider).acquire()
+        try:
+            return await asyncio.to_thread(_send, client, provider, messages, model)
+        except _TRANSIENT_ERRORS as e:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = _backoff_delay(attempt)
+            print(f"[RETRY {attempt + 1}/{MAX_ATTEMPTS - 1}] {type(e).__name__}; waiting {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -2,19 +2,24 @@ import os
 import csv
 import time
 import json
+import logging
 import openai
 from openai import OpenAI
 
 
 from src.gen import generate_codebase
-from src.utils import append_result, log_result, initialize_data_dict
+from src.utils import append_result, log_result, initialize_data_dict, load_checkpoint, append_checkpoint
 from src.code_analysis import modify_codebase, extract_graph, modify_and_extract
 from src.graph_utils import flip_adjacency, safe_flip, _normalise_adj, _without_main
 from src.test_engine import run_llm_tests, precision_and_err_rate, static_completeness_ok
-from src.experiment_runner import run_topology_experiment_with_provider, display_debug_info
-from src.llm_interface import setup_client, send_message
+from src.experiment_runner import run_topology_experiment_with_provider, run_topology_experiments, display_debug_info
+from src.llm_interface import setup_client, send_message, CACHE_STATS
 
 CSV_FILE = "experiment_results.csv"
+CHECKPOINT_FILE = "experiment_checkpoint.jsonl"   # (topology, length, changes) of finished sweeps
+AVG_LENGTHS = [5, 7, 9, 11, 13, 15]
+NUM_CHANGES = [1, 2, 3, 4, 5]
+TOPOLOGIES = ("chain", "branch", "random")
 FIELDNAMES = [
     "timestamp",
     "topology",
@@ -43,57 +48,60 @@ Generate a JSON object that describes a codebase with the following properties:
 - tests: dict {"node": [], "test": [], "input": [], "output": [], "result": []}
 """
 
+def pending_sweeps(done):
+    """(topology, length, changes) of every sweep in the grid not in done, in run order."""
+    return [
+        (topology, length, changes)
+        for length in AVG_LENGTHS
+        for changes in NUM_CHANGES
+        for topology in TOPOLOGIES
+        if (topology, length, changes) not in done
+    ]
+
+def checkpoint_key(experiment):
+    """The checkpoint key of one run_topology_experiments experiment dict."""
+    return (experiment["topology_mode"], experiment["avg_length"], experiment["num_changes"])
+
 def main():
+    # display_debug_info logs at DEBUG; raise this to INFO to skip formatting it
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("src.experiment_runner").setLevel(logging.DEBUG)
+    # set to DEBUG to log every request (contents truncated) and reply
+    logging.getLogger("src.llm_interface").setLevel(logging.INFO)
+
     provider = "groq"  # Change to "openai" or "groq"
     model_name = "llama3-70b-8192" if provider == "groq" else "o3-mini"
 
     client = setup_client(provider)
     chain_ai_data, branch_ai_data, random_ai_data = initialize_data_dict(), initialize_data_dict(), initialize_data_dict()
 
-    for length in [5, 7, 9, 11, 13, 15]:
-        for changes in [1, 2, 3, 4, 5]:
-            run_topology_experiment_with_provider(
-                "chain",
-                generate_codebase,
-                client,
-                structured_prompt,
-                structured_prompt_2,
-                chain_ai_data,
-                avg_length=length,
-                num_changes=changes,
-                provider=provider,
-                model=model_name,
-                debug_callback=display_debug_info,
-                use_semantics=False
-            )
-            run_topology_experiment_with_provider(
-                "branch",
-                generate_codebase,
-                client,
-                structured_prompt,
-                structured_prompt_2,
-                branch_ai_data,
-                avg_length=length,
-                num_changes=changes,
-                provider=provider,
-                model=model_name,
-                debug_callback=display_debug_info,
-                use_semantics=False
-            )
-            run_topology_experiment_with_provider(
-                "random",
-                generate_codebase,
-                client,
-                structured_prompt,
-                structured_prompt_2,
-                random_ai_data,
-                avg_length=length,
-                num_changes=changes,
-                provider=provider,
-                model=model_name,
-                debug_callback=display_debug_info,
-                use_semantics=False
-            )
+    ai_data = {"chain": chain_ai_data, "branch": branch_ai_data, "random": random_ai_data}
+
+    # Every (length, changes, topology) sweep is independent, so they all run
+    # at once; results are still recorded in this loop order. Sweeps already
+    # in the checkpoint file (from an interrupted run) are skipped.
+    experiments = [
+        dict(
+            topology_mode=topology,
+            codebase_generator=generate_codebase,
+            client=client,
+            structured_prompt=structured_prompt,
+            structured_prompt_2=structured_prompt_2,
+            ai_data=ai_data[topology],
+            avg_length=length,
+            num_changes=changes,
+            provider=provider,
+            model=model_name,
+            debug_callback=display_debug_info,
+            use_semantics=False
+        )
+        for topology, length, changes in pending_sweeps(load_checkpoint(CHECKPOINT_FILE))
+    ]
+    run_topology_experiments(experiments, on_recorded=lambda e: append_checkpoint(CHECKPOINT_FILE, checkpoint_key(e)))
+
+    lookups = CACHE_STATS["hits"] + CACHE_STATS["misses"]
+    if lookups:
+        print(f"LLM cache (LLM_CACHE_ENABLE=1): {CACHE_STATS['hits']}/{lookups} replies were replayed from .llm_cache, not sampled")
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,10 @@
 import collections
+import functools
 import types
 
 _BAD_TEST = object()                     # sentinel for impossible key look‑ups
 _ALT_NODE_KEYS = {"name", "target", "id"}      # common mistakes by the LLM
-_REQ_KEYS      = {"node", "test", "result"}    # minimum we need
+_REQ_KEYS      = frozenset({"node", "test", "result"})    # minimum we need
 
 def _normalise_tests(tests_block):
     """
@@ -64,9 +65,23 @@ def static_completeness_ok(tests_dict: dict, node_list: list) -> bool:
     if not all(_REQ_KEYS <= t.keys() for t in tests):
         return False
 
-    wanted = collections.Counter({n: 2 for n in node_list})
-    seen   = collections.Counter(t.get("node", _BAD_TEST) for t in tests)
-    return wanted == seen
+    seen  = collections.Counter(t.get("node", _BAD_TEST) for t in tests)
+    nodes = set(node_list)
+    return len(seen) == len(nodes) and all(seen[n] == 2 for n in nodes)
+
+@functools.lru_cache(maxsize=32)
+def _compile_sut(code_str: str):
+    """
+    Code object for a codebase under test. The same code is tested again
+    whenever a reply is re-scored, so the parse/compile is memoized; each run
+    still executes it into a fresh module so tests never share globals.
+    """
+    return compile(code_str, "<sut>", "exec")
+
+@functools.lru_cache(maxsize=1024)
+def _compile_test(test_src: str):
+    """Code object for one test snippet; shared by every run that replays it."""
+    return compile(test_src, "<test>", "exec")
 
 def run_llm_tests(code_str: str, tests_dict: dict):
     """
@@ -78,7 +93,7 @@ def run_llm_tests(code_str: str, tests_dict: dict):
         return []                               # nothing to run
 
     mod = types.ModuleType("sut")
-    exec(compile(code_str, "<sut>", "exec"), mod.__dict__)
+    exec(_compile_sut(code_str), mod.__dict__)
 
     out = []
     for t in tests:
@@ -88,7 +103,7 @@ def run_llm_tests(code_str: str, tests_dict: dict):
         want_pass   = t["result"].lower() == "pass"
         predicted_e = t.get("error", "")
         try:
-            exec(t["test"], mod.__dict__)
+            exec(_compile_test(t["test"]), mod.__dict__)
             actual_pass, actual_err = True, ""
         except Exception as e:
             actual_pass, actual_err = False, type(e).__name__
@@ -1,47 +1,213 @@
 import os
 import csv
+import json
 import time
+import queue
+import atexit
+import threading
+import numpy as np
 
 CSV_FILE = "experiment_results.csv"
 FIELDNAMES = [
     "timestamp", "topology", "num_nodes", "avg_length", "input_tokens",
     "num_changes", "correct_initial_adj", "correct_adj_after_changes",
-    "tests_complete", "pf_precision", "exception_match_rate",
+    "tests_complete", "pf_precision", "exception_match_rate", "cached_tokens",
 ]
 
+# One record per obj_count step; ai_data keys map onto these fields.
+RESULTS_DTYPE = np.dtype([
+    ("num_nodes", "i4"), ("avg_length", "f8"), ("input_tokens", "i4"),
+    ("correct_adj", "?"), ("adj_match", "f8"), ("num_changes", "i2"),
+    ("correct_after", "?"), ("tests_complete", "?"),
+    ("pf_precision", "f8"), ("exception_rate", "f8"), ("cached_tokens", "i4"),
+])
+DATA_KEYS = {
+    "Number of Nodes":        "num_nodes",
+    "Avg Length":             "avg_length",
+    "Input Tokens":           "input_tokens",
+    "Correct Adjacency?":     "correct_adj",
+    "Adjacency Match %":      "adj_match",
+    "Number of Changes":      "num_changes",
+    "Correct After Changes?": "correct_after",
+    "Tests Complete?":        "tests_complete",
+    "Pass/Fail Precision":    "pf_precision",
+    "Exception Match Rate":   "exception_rate",
+    "Cached Tokens":          "cached_tokens",
+}
+
+def new_results(n):
+    """Preallocate n result records: counts 0, flags False, rates NaN."""
+    results = np.zeros(n, dtype=RESULTS_DTYPE)
+    for field in ("adj_match", "pf_precision", "exception_rate"):
+        results[field] = np.nan
+    return results
+
+_log_queue = None               # rows waiting for the writer thread
+
+class _CsvWriter:
+    """
+    Keeps CSV_FILE open across appends instead of reopening it per batch.
+    Rows are flushed and fsynced every FLUSH_EVERY rows, on flush() and at
+    exit.
+    """
+
+    FLUSH_EVERY = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fh = self._writer = self._path = None
+        self._unsynced = 0
+        atexit.register(self.close)
+
+    def write(self, rows):
+        with self._lock:
+            if self._path != CSV_FILE:
+                self._reopen()
+            self._writer.writerows({**{k: "" for k in FIELDNAMES}, **row} for row in rows)
+            self._unsynced += len(rows)
+            if self._unsynced >= self.FLUSH_EVERY:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            if self._fh is not None:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _reopen(self):
+        self._close()
+        fieldnames = None
+        if os.path.exists(CSV_FILE):
+            # keep appending in the file's own column layout, so a results file
+            # from before a column was added stays readable
+            with open(CSV_FILE, newline="", encoding="utf-8") as fh:
+                fieldnames = next(csv.reader(fh), None)
+        self._fh = open(CSV_FILE, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._fh, fieldnames=fieldnames or FIELDNAMES, extrasaction="ignore")
+        self._path = CSV_FILE
+        if not fieldnames:
+            self._writer.writeheader()
+
+    def _sync(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+
+    def _close(self):
+        if self._fh is not None:
+            self._sync()
+            self._fh.close()
+            self._fh = self._writer = self._path = None
+
+_csv_writer = _CsvWriter()
+
 def append_result(row_dict):
-    new_file = not os.path.exists(CSV_FILE)
-    with open(CSV_FILE, "a", newline="", encoding="utf-8") as fh:
-        writer = csv.DictWriter(fh, fieldnames=FIELDNAMES)
-        if new_file:
-            writer.writeheader()
-        writer.writerow({**{k: "" for k in FIELDNAMES}, **row_dict})
-        fh.flush()
+    append_results([row_dict])
+
+def append_results(rows):
+    _csv_writer.write(rows)
+
+def _log_writer(q):
+    """Drain q into the CSV, writing whatever has piled up in one open/flush."""
+    while True:
+        rows = [q.get()]
+        while True:
+            try:
+                rows.append(q.get_nowait())
+            except queue.Empty:
+                break
+        done = None in rows
+        batch = [row for row in rows if row is not None]
+        try:
+            if batch:
+                append_results(batch)
+        except Exception as e:
+            print("[ERROR - LOG WRITER]:", e)
+        for _ in rows:
+            q.task_done()
+        if done:
+            return
+
+def _get_log_queue():
+    global _log_queue
+    if _log_queue is None:
+        _log_queue = queue.Queue(maxsize=1024)
+        writer = threading.Thread(target=_log_writer, args=(_log_queue,), daemon=True)
+        writer.start()
+
+        def shutdown():
+            _log_queue.put(None)
+            writer.join()
+        atexit.register(shutdown)
+    return _log_queue
 
-def log_result(topology, node_count, avg_len, tokens, changes, data_dict):
-    append_result({
+def flush_results():
+    """Block until every queued log_result row is on disk."""
+    if _log_queue is not None:
+        _log_queue.join()
+    _csv_writer.flush()
+
+def log_result(topology, record):
+    """Queue one result row; a background thread appends it to CSV_FILE."""
+    _get_log_queue().put({
         "timestamp":             time.strftime("%Y-%m-%d %H:%M:%S"),
         "topology":              topology,
-        "num_nodes":             node_count,
-        "avg_length":            avg_len,
-        "input_tokens":          tokens,
-        "num_changes":           changes,
-        "correct_initial_adj":       data_dict["Correct Adjacency?"][-1],
-        "correct_adj_after_changes": data_dict["Correct After Changes?"][-1],
-        "tests_complete":        data_dict["Tests Complete?"][-1],
-        "pf_precision":          data_dict["Pass/Fail Precision"][-1],
-        "exception_match_rate":  data_dict["Exception Match Rate"][-1],
+        "num_nodes":             int(record["num_nodes"]),
+        "avg_length":            float(record["avg_length"]),
+        "input_tokens":          int(record["input_tokens"]),
+        "num_changes":           int(record["num_changes"]),
+        "correct_initial_adj":       bool(record["correct_adj"]),
+        "correct_adj_after_changes": bool(record["correct_after"]),
+        "tests_complete":        bool(record["tests_complete"]),
+        "pf_precision":          float(record["pf_precision"]),
+        "exception_match_rate":  float(record["exception_rate"]),
+        "cached_tokens":         int(record["cached_tokens"]),
     })
 
+def load_checkpoint(path):
+    """
+    Keys of the sweeps already recorded in a checkpoint file, as a set of
+    tuples. Lines that do not parse (a torn last line after a crash) are
+    skipped.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            try:
+                done.add(tuple(json.loads(line)["key"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+def append_checkpoint(path, key):
+    """
+    Mark one sweep as recorded. Its CSV rows are flushed first and the line
+    is fsynced, so a key in the file always means the rows are on disk. A
+    torn last line left by a crash is terminated first, so the new key does
+    not get glued onto it.
+    """
+    flush_results()
+    with open(path, "ab+") as fh:
+        fh.seek(0, os.SEEK_END)
+        if fh.tell():
+            fh.seek(-1, os.SEEK_END)
+            if fh.read(1) != b"\n":
+                fh.write(b"\n")
+        line = json.dumps({"key": list(key), "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")}) + "\n"
+        fh.write(line.encode("utf-8"))
+        fh.flush()
+        os.fsync(fh.fileno())
+
+def extend_data_dict(data_dict, results):
+    """Append every field of a results array to the matching ai_data column."""
+    for key, field in DATA_KEYS.items():
+        data_dict[key] = np.concatenate((data_dict[key], results[field]))
+
 def initialize_data_dict():
-    return {
-        "Number of Nodes": [],
-        "Avg Length": [],
-        "Input Tokens": [],
-        "Correct Adjacency?": [],
-        "Number of Changes": [],
-        "Correct After Changes?": [],
-        "Tests Complete?": [],
-        "Pass/Fail Precision": [],
-        "Exception Match Rate": []
-    }
+    """ai_data: one typed NumPy column per key, grown a sweep at a time."""
+    return {key: np.empty(0, dtype=RESULTS_DTYPE[field]) for key, field in DATA_KEYS.items()}
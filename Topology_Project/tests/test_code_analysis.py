@@ -19,3 +19,17 @@ def test_extract_graph_simple_call():
     assert "foo" in nodes
     assert "bar" in nodes
     assert {"from": "foo", "to": "bar"} in adjacency
+
+def test_modify_codebase_accepts_output_types_outside_data_types():
+    from src.gen import DATA_TYPES
+
+    nodes = [("Function_0", "function", "int", "bytes"), ("Function_1", "function", "bytes", "decimal")]
+    adjacency = [[], [0]]
+    _, changes, new_nodes, _ = modify_codebase("", nodes, adjacency, num_changes=2, seed=3)
+    assert changes == 2
+    assert all(output in DATA_TYPES for _, _, _, output in new_nodes)
+
+def test_modify_codebase_always_changes_known_output_types():
+    nodes = [(f"Function_{i}", "function", "int", "str") for i in range(6)]
+    _, _, new_nodes, _ = modify_codebase("", nodes, [[] for _ in nodes], num_changes=6, seed=4)
+    assert all(output != "str" for _, _, _, output in new_nodes)
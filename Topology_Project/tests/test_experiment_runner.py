@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import random
+import threading
+
+import numpy as np
+
+from src import experiment_runner, gen
+from src.experiment_runner import _initial_stage, _modified_stage, _validate_adj, run_topology_experiments
+from src.utils import initialize_data_dict, new_results
+
+def test_modified_stage_records_failed_row_when_mutation_raises():
+    async def failing_mutation():
+        raise ValueError("no call sites left to mutate")
+
+    async def run(record):
+        mod_task = asyncio.create_task(failing_mutation())
+        await _modified_stage(asyncio.Semaphore(1), record, [], mod_task, "chain", None, "prompt", "openai", "model", None)
+
+    results = new_results(1)
+    asyncio.run(run(results[0]))
+    assert results[0]["num_changes"] == 0
+    assert not results[0]["correct_after"]
+    assert np.isnan(results[0]["pf_precision"])
+
+def test_validate_adj_rejects_non_dict_adjacency():
+    for adjacency in ([{"from": 0, "to": 1}], "0->1", None, 3):
+        ok, reason = _validate_adj(adjacency)
+        assert not ok and isinstance(reason, str)
+
+def test_validate_adj_rejects_missing_keys():
+    for adjacency in ({}, {"from": [0]}, {"to": [1]}):
+        assert _validate_adj(adjacency) == (False, "'from' and 'to' must be lists")
+
+def test_validate_adj_rejects_non_list_values():
+    for adjacency in ({"from": 0, "to": 1}, {"from": "01", "to": [1, 2]}, {"from": (0,), "to": (1,)}, {"from": {"a": 0}, "to": [1]}):
+        assert _validate_adj(adjacency) == (False, "'from' and 'to' must be lists")
+
+def test_validate_adj_rejects_length_mismatch():
+    assert _validate_adj({"from": [0, 1], "to": [2]}) == (False, "Mismatch in 'from' and 'to' lengths")
+
+def test_validate_adj_drops_non_int_entries_keeping_columns_aligned():
+    adjacency = {"from": [0, {"id": 1}, "2", True, None, 4], "to": ["1", 2, [3], 3, 4, "x"]}
+    assert _validate_adj(adjacency) == (True, {"from": [0], "to": [1]})
+
+def _seeded_sweep_codes(monkeypatch, run_seed):
+    """
+    Generated and mutated code of a small concurrent grid, run after
+    gen.seed(run_seed), and the response-cache trial ids it asked for.
+    """
+    codes, trials = {}, []
+    jitter = random.Random()            # unseeded, to vary how the trials interleave
+
+    def generate(**kwargs):
+        code, nodes, adj = gen.generate_codebase(**kwargs)
+        codes[(kwargs["topology_mode"], kwargs["avg_length"], kwargs["num_objects"], "code")] = code
+        return code, nodes, adj
+
+    real_modify = experiment_runner.modify_and_extract
+
+    def modify(code, nodes, adj, num_changes, seed=None):
+        result = real_modify(code, nodes, adj, num_changes, seed=seed)
+        codes[(hashlib.blake2b(code.encode()).hexdigest(), "mutated")] = result[0]
+        return result
+
+    async def reply(client, provider, messages, model, trial=None):
+        trials.append(tuple(trial))
+        await asyncio.sleep(jitter.random() / 1000)
+        return '{"nodes": [], "adjacency": {"from": [], "to": []}, "tests": {}}', 0
+
+    monkeypatch.setattr(experiment_runner, "send_message_async", reply)
+    monkeypatch.setattr(experiment_runner, "modify_and_extract", modify)
+    monkeypatch.setattr(experiment_runner, "log_result", lambda topology, record: None)
+    monkeypatch.setattr(experiment_runner, "OBJ_COUNTS", range(10, 31, 5))
+
+    gen.seed(run_seed)
+    experiments = [
+        dict(topology_mode=topology, codebase_generator=generate, client=None,
+             structured_prompt="p1", structured_prompt_2="p2", ai_data=initialize_data_dict(),
+             avg_length=length, num_changes=2, provider="openai", model="model")
+        for length in (5, 7)
+        for topology in ("chain", "branch", "random")
+    ]
+    run_topology_experiments(experiments, max_concurrency=4)
+    return codes, sorted(trials)
+
+def test_seeded_sweeps_generate_and_mutate_the_same_code_every_run(monkeypatch):
+    first, _ = _seeded_sweep_codes(monkeypatch, 7)
+    assert len(first) == 2 * 2 * 3 * 5
+    assert _seeded_sweep_codes(monkeypatch, 7)[0] == first
+    assert _seeded_sweep_codes(monkeypatch, 8)[0] != first
+
+def test_cache_trial_ids_are_per_trial_and_stable_under_a_seed(monkeypatch):
+    _, first = _seeded_sweep_codes(monkeypatch, 7)
+    assert len(first) == 2 * 2 * 3 * 5               # both stages of every trial
+    assert len(set(first)) == 2 * 3 * 5              # one id per trial
+    assert _seeded_sweep_codes(monkeypatch, 7)[1] == first
+    assert not set(_seeded_sweep_codes(monkeypatch, 8)[1]) & set(first)
+
+def test_initial_stage_records_cached_prompt_tokens(monkeypatch):
+    async def reply(client, provider, messages, model, trial=None):
+        return '{"nodes": ["a", "b"], "adjacency": {"from": [0], "to": [1]}}', 1500
+
+    monkeypatch.setattr(experiment_runner, "send_message_async", reply)
+    results = new_results(1)
+    conversation = asyncio.run(_initial_stage(asyncio.Semaphore(1), results[0], ["a", "b"], [[], [0]], "chain", None, "prompt", 5, "anthropic", "model", None))
+    assert conversation is not None
+    assert results[0]["cached_tokens"] == 1500
+    assert results[0]["correct_adj"]
+
+def test_on_recorded_runs_off_the_event_loop_thread_in_order(monkeypatch):
+    def no_codebase(**kwargs):
+        raise ValueError("skip generation")
+
+    monkeypatch.setattr(experiment_runner, "OBJ_COUNTS", range(10, 16, 5))
+    recorded = []
+    experiments = [
+        dict(topology_mode=topology, codebase_generator=no_codebase, client=None,
+             structured_prompt="p1", structured_prompt_2="p2", ai_data=initialize_data_dict(),
+             avg_length=5, num_changes=1, provider="openai", model="model")
+        for topology in ("chain", "branch", "random")
+    ]
+    run_topology_experiments(experiments, on_recorded=lambda e: recorded.append((e["topology_mode"], threading.current_thread())))
+    assert [topology for topology, _ in recorded] == ["chain", "branch", "random"]
+    assert all(thread is not threading.main_thread() for _, thread in recorded)
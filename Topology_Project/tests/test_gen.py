@@ -0,0 +1,70 @@
+import hashlib
+
+import numpy as np
+import pytest
+from src import gen
+
+# sha256 of the generated source for gen.seed(2024), 12 objects, avg_length 8.
+# A change here means seeded output changed; update only on purpose.
+PINNED_CODEBASES = {
+    "chain": "dee983063bb1e556a8a70d1aa3c3d13f53737cb0e7fa28f53e104602913e7f1c",
+    "branch": "060307cb692a4b08d92f3b4e92f4d762623ad78fc7924eed3c7ea60fdf2c5e49",
+    "random": "7e027258302ac9a3760bda4067311f17b12db0532089456b0a3ece50e7efe47b",
+}
+PINNED_REGENERATED = "0b4e5a8ae0393787c4bf8c2a522144e1400f15ff67318451ce6c72cdc1649329"
+
+def _digest(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+def _seeded_codebase(topology_mode):
+    gen.seed(2024)
+    return gen.generate_codebase(num_objects=12, avg_length=8, topology_mode=topology_mode)
+
+@pytest.mark.parametrize("topology_mode", sorted(PINNED_CODEBASES))
+def test_generate_codebase_is_pinned_by_seed(topology_mode):
+    code, _, _ = _seeded_codebase(topology_mode)
+    assert _digest(code) == PINNED_CODEBASES[topology_mode]
+    assert _seeded_codebase(topology_mode)[0] == code
+
+def test_generate_code_from_nodes_is_pinned_by_seed():
+    _, nodes, adj = _seeded_codebase("random")
+    gen.seed(5)
+    assert _digest(gen.generate_code_from_nodes(nodes, adj)) == PINNED_REGENERATED
+
+def test_different_seeds_give_different_code():
+    gen.seed(1)
+    first = gen.generate_codebase(num_objects=12, avg_length=8)[0]
+    gen.seed(2)
+    assert gen.generate_codebase(num_objects=12, avg_length=8)[0] != first
+
+def _check_ordered_pairs(first, second, n):
+    first, second = np.asarray(first), np.asarray(second)
+    assert first.shape == second.shape
+    assert ((0 <= first) & (first < second) & (second < n)).all()
+    assert len(set(zip(first.tolist(), second.tolist()))) == first.size
+
+@pytest.mark.parametrize("p", [0.0, 0.05, gen._DENSE_CONNECTIVITY, np.nextafter(gen._DENSE_CONNECTIVITY, 1), 0.6, 1.0])
+@pytest.mark.parametrize("n", [0, 1, 2, 7, 300])
+def test_sample_ordered_pairs_are_ordered_unique_and_in_range(n, p):
+    gen.seed(11)
+    first, second = gen._sample_ordered_pairs(n, p)
+    _check_ordered_pairs(first, second, n)
+    if p == 0.0:
+        assert first.size == 0
+    if p == 1.0:
+        assert first.size == n * (n - 1) // 2
+
+@pytest.mark.parametrize("p", [gen._DENSE_CONNECTIVITY, np.nextafter(gen._DENSE_CONNECTIVITY, 1)])
+def test_sample_ordered_pairs_keeps_about_p_of_the_slots_either_side_of_the_cutoff(p):
+    gen.seed(12)
+    n = 400
+    first, _ = gen._sample_ordered_pairs(n, p)
+    assert abs(first.size / (n * (n - 1) // 2) - p) < 0.01
+
+def test_sample_ordered_pairs_geometric_gaps_decode_every_slot(monkeypatch):
+    # with the dense branch switched off, p=1 must visit every slot exactly once
+    monkeypatch.setattr(gen, "_DENSE_CONNECTIVITY", 1.0)
+    n = 2000
+    first, second = gen._sample_ordered_pairs(n, 1.0)
+    _check_ordered_pairs(first, second, n)
+    assert first.size == n * (n - 1) // 2
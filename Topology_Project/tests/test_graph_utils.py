@@ -0,0 +1,42 @@
+import pytest
+from src.graph_utils import _adj_pairs, _normalise_adj, _without_main, pair_set, same_edge_set, flip_adjacency, safe_flip, compute_match_percentage
+
+def test_pair_set_matches_normalise_and_filter():
+    adj = {"from": [0, "main", 1, 0], "to": [1, 2, "main", 1]}
+    expected = frozenset(_without_main(_normalise_adj(adj)))
+    assert pair_set(tuple(adj["from"]), tuple(adj["to"])) == expected == {(0, 1)}
+
+def test_same_edge_set_ignores_order_and_duplicates():
+    gold = [(i, j) for i in range(20) for j in range(i + 1, 20)]
+    pred = list(reversed(gold)) + gold[:5]
+    assert same_edge_set(gold, pred)
+    assert not same_edge_set(gold, pred[1:] + [(0, 0)] * 5)
+    assert same_edge_set([("a", "b")], [("a", "b"), ("a", "b")])
+    assert not same_edge_set([(0, 1)], [("0", "1")])
+
+def test_adj_pairs_matches_normalise_and_filter():
+    blocks = [
+        {"from": [0, "main", 1], "to": [1, 2, "main"]},
+        [{"from": "a", "to": "b"}, {"from": "main", "to": "b"}, {"to": "c"}],
+        "not an adjacency",
+    ]
+    for block in blocks:
+        assert list(_adj_pairs(block)) == _without_main(_normalise_adj(block))
+
+def test_safe_flip_never_raises_on_malformed_adjacency():
+    for bad in (None, {}, "x", [{"from": "a", "to": "b"}], {"from": [1]}, {"from": 5, "to": [1]}):
+        assert safe_flip(bad) == {"from": [], "to": []}
+    assert safe_flip({"from": [1, 2, 3], "to": [4, 5]}) == {"from": [4, 5], "to": [1, 2]}
+
+def test_flip_adjacency_rejects_malformed_adjacency():
+    for bad in (None, "x", [{"from": "a", "to": "b"}], {"from": [1]}, {"from": [1], "to": []}):
+        with pytest.raises(ValueError):
+            flip_adjacency(bad)
+    assert flip_adjacency({"from": [1, 2], "to": [3, 4]}) == {"from": [3, 4], "to": [1, 2]}
+
+def test_compute_match_percentage():
+    gold = frozenset({(0, 1), (1, 2), (2, 3)})
+    assert compute_match_percentage(gold, gold) == 100.0
+    assert compute_match_percentage(gold, frozenset({(0, 1), (9, 9)})) == 33.33
+    assert compute_match_percentage(frozenset(), frozenset()) == 100.0
+    assert compute_match_percentage(frozenset(), frozenset({(0, 1)})) == 0.0
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from src import llm_interface
+from src.llm_interface import ClientPool, TokenBucket, _read_json_stream
+
+def _pieces(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_read_json_stream_returns_object_split_across_pieces():
+    reply = '{"nodes": ["a", "b"], "adjacency": {"from": [0], "to": [1]}}'
+    assert _read_json_stream(_pieces(reply)) == reply
+
+def test_read_json_stream_stops_at_the_closing_brace():
+    def stream():
+        yield '{"a": 1}'
+        raise AssertionError("read past the end of the object")
+    assert _read_json_stream(stream()) == '{"a": 1}'
+
+def test_read_json_stream_strips_code_fence():
+    reply = '```json\n{"a": [1, 2]}\n```\nHope this helps!'
+    assert _read_json_stream(_pieces(reply)) == '{"a": [1, 2]}'
+
+def test_read_json_stream_ignores_braces_and_escapes_inside_strings():
+    obj = '{"a": "}{", "b": "say \\"{hi}\\"", "c": "back\\\\"}'
+    assert json.loads(obj)["c"] == "back\\"
+    assert _read_json_stream(_pieces(obj, 1)) == obj
+
+def test_read_json_stream_nested_objects():
+    obj = '{"a": {"b": {"c": {}}}, "d": [{"e": 1}]}'
+    assert _read_json_stream(_pieces("Result: " + obj + " done", 2)) == obj
+
+def test_read_json_stream_skips_balanced_braces_in_prose():
+    assert _read_json_stream(['Here {x} is: ', '{"a": "}"}']) == '{"a": "}"}'
+
+def test_read_json_stream_skips_prose_brace_with_unbalanced_quote():
+    assert _read_json_stream(['Here {x" is: ', '{"a": 1}']) == '{"a": 1}'
+
+def test_read_json_stream_returns_whole_text_without_an_object():
+    assert _read_json_stream(["I can't ", "do that {sorry"]) == "I can't do that {sorry"
+    assert _read_json_stream([]) == ""
+
+def test_read_json_stream_strips_prose_with_quotes_and_apostrophes():
+    reply = 'Sure! Here\'s the "graph" you asked for: {"a": 1}'
+    assert _read_json_stream(_pieces(reply)) == '{"a": 1}'
+
+def test_read_json_stream_skips_non_json_brace_block_in_prose():
+    reply = 'Each edge is {from: parent, to: child}, so:\n{"from": [0], "to": [1]}'
+    assert _read_json_stream(_pieces(reply, 4)) == '{"from": [0], "to": [1]}'
+
+def test_read_json_stream_skips_prose_brace_split_across_pieces():
+    assert _read_json_stream(["Format {", "x}: ", '{"a"', ': 2}']) == '{"a": 2}'
+
+def test_read_json_stream_returns_first_of_several_objects():
+    assert _read_json_stream(['{"a": 1} or maybe {"b": 2}']) == '{"a": 1}'
+
+def test_response_cache_is_keyed_per_trial(monkeypatch):
+    replies = iter(["first", "second", "third"])
+
+    async def fake_fetch(client, provider, messages, model):
+        return next(replies), 0
+
+    monkeypatch.setattr(llm_interface, "_fetch", fake_fetch)
+    monkeypatch.setattr(llm_interface, "_response_cache", {})
+    monkeypatch.setenv("LLM_CACHE_ENABLE", "1")
+    messages = [{"role": "user", "content": "same prompt"}]
+
+    async def ask(trial):
+        reply, _ = await llm_interface.send_message_async(None, "openai", messages, "model", trial)
+        return reply
+
+    assert asyncio.run(ask(["chain", 0])) == "first"
+    assert asyncio.run(ask(["chain", 1])) == "second"
+    assert asyncio.run(ask(["chain", 0])) == "first"
+
+def test_response_cache_is_off_by_default(monkeypatch):
+    replies = iter(["first", "second"])
+
+    async def fake_fetch(client, provider, messages, model):
+        return next(replies), 0
+
+    monkeypatch.setattr(llm_interface, "_fetch", fake_fetch)
+    monkeypatch.setattr(llm_interface, "_response_cache", {})
+    monkeypatch.delenv("LLM_CACHE_ENABLE", raising=False)
+    messages = [{"role": "user", "content": "same prompt"}]
+
+    async def ask():
+        reply, _ = await llm_interface.send_message_async(None, "openai", messages, "model", ["chain", 0])
+        return reply
+
+    assert asyncio.run(ask()) == "first"
+    assert asyncio.run(ask()) == "second"
+    assert llm_interface._response_cache == {}
+
+def test_token_bucket_allows_a_burst_then_paces_at_rate():
+    async def timed_acquires(bucket, count):
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    bucket = TokenBucket(rate=50, capacity=3)
+    assert asyncio.run(timed_acquires(bucket, 3)) < 0.05
+    assert asyncio.run(timed_acquires(bucket, 5)) >= 0.09     # 5 tokens at 50/s, minus refill slack
+
+class _FlakyClient:
+    """Stands in for _send: raises the queued errors, then replies."""
+
+    def __init__(self, errors, reply="{}"):
+        self.errors = list(errors)
+        self.reply = reply
+        self.calls = 0
+
+    def __call__(self, client, provider, messages, model):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.reply, 0
+
+class _CountingBucket:
+    def __init__(self):
+        self.acquired = 0
+
+    async def acquire(self):
+        self.acquired += 1
+
+@pytest.fixture
+def no_waiting(monkeypatch):
+    """No backoff sleeps; every provider gets one counting, never-blocking bucket."""
+    bucket = _CountingBucket()
+    monkeypatch.setattr(llm_interface, "_backoff_delay", lambda attempt: 0)
+    monkeypatch.setattr(llm_interface, "_rate_limit", lambda provider: bucket)
+    return bucket
+
+def _fetch(client="client", provider="openai"):
+    reply, _ = asyncio.run(llm_interface._fetch(client, provider, [{"role": "user", "content": "hi"}], "model"))
+    return reply
+
+def test_fetch_retries_transient_errors_under_the_rate_limit(monkeypatch, no_waiting):
+    flaky = _FlakyClient([google_exceptions.ServiceUnavailable("busy")] * 2, reply='{"ok": 1}')
+    monkeypatch.setattr(llm_interface, "_send", flaky)
+    assert _fetch() == '{"ok": 1}'
+    assert flaky.calls == no_waiting.acquired == 3
+
+def test_fetch_gives_up_after_max_attempts(monkeypatch, no_waiting):
+    flaky = _FlakyClient([google_exceptions.ResourceExhausted("quota")] * llm_interface.MAX_ATTEMPTS)
+    monkeypatch.setattr(llm_interface, "_send", flaky)
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        _fetch()
+    assert flaky.calls == llm_interface.MAX_ATTEMPTS
+
+def test_fetch_does_not_retry_other_errors(monkeypatch, no_waiting):
+    flaky = _FlakyClient([ValueError("bad request")])
+    monkeypatch.setattr(llm_interface, "_send", flaky)
+    with pytest.raises(ValueError):
+        _fetch()
+    assert flaky.calls == 1
+
+def test_pool_attempts_go_through_rate_limit_and_retries(monkeypatch, no_waiting):
+    flaky = _FlakyClient([google_exceptions.ServiceUnavailable("busy")], reply='{"ok": 2}')
+    monkeypatch.setattr(llm_interface, "_send", flaky)
+    pool = ClientPool([("openai", "client", "model")])
+    assert _fetch(pool) == '{"ok": 2}'
+    assert flaky.calls == no_waiting.acquired == 2
+
+class _PerClient:
+    """_send stand-in dispatching to a _FlakyClient per client name."""
+
+    def __init__(self, **clients):
+        self.clients = clients
+
+    def __call__(self, client, provider, messages, model):
+        return self.clients[client](client, provider, messages, model)
+
+def test_pool_retries_transient_errors_before_failing_over(monkeypatch, no_waiting):
+    first = _FlakyClient([google_exceptions.ServiceUnavailable("busy")] * (llm_interface.MAX_ATTEMPTS - 1), reply='{"from": "first"}')
+    second = _FlakyClient([], reply='{"from": "second"}')
+    monkeypatch.setattr(llm_interface, "_send", _PerClient(first=first, second=second))
+    pool = ClientPool([("openai", "first", "model"), ("groq", "second", "model")])
+    assert _fetch(pool) == '{"from": "first"}'
+    assert (first.calls, second.calls) == (llm_interface.MAX_ATTEMPTS, 0)
+
+def test_pool_fails_over_when_retries_are_exhausted_or_error_is_not_transient(monkeypatch, no_waiting):
+    exhausted = _FlakyClient([google_exceptions.ServiceUnavailable("busy")] * llm_interface.MAX_ATTEMPTS)
+    rejected = _FlakyClient([ValueError("bad request")])
+    healthy = _FlakyClient([], reply='{"from": "healthy"}')
+    monkeypatch.setattr(llm_interface, "_send", _PerClient(exhausted=exhausted, rejected=rejected, healthy=healthy))
+    pool = ClientPool([("openai", "exhausted", "m"), ("groq", "rejected", "m"), ("anthropic", "healthy", "m")], concurrency=1)
+    pool._least_busy = lambda tried: min(set(range(3)) - tried, default=None)   # try endpoints in order
+    assert _fetch(pool) == '{"from": "healthy"}'
+    assert (exhausted.calls, rejected.calls, healthy.calls) == (llm_interface.MAX_ATTEMPTS, 1, 1)
+
+def test_pool_raises_last_error_when_every_endpoint_fails(monkeypatch, no_waiting):
+    monkeypatch.setattr(llm_interface, "_send", _FlakyClient([ValueError("a"), KeyError("b")]))
+    pool = ClientPool([("openai", "a", "m"), ("groq", "b", "m")])
+    with pytest.raises(KeyError):
+        _fetch(pool)
+
+def test_read_json_stream_skips_none_and_empty_pieces_mid_stream():
+    pieces = [None, '{"nodes": [', None, "", '"a"], "adjacency": ', None, '{"from": [], "to": []}}']
+    assert _read_json_stream(pieces) == '{"nodes": ["a"], "adjacency": {"from": [], "to": []}}'
+
+def test_chat_completions_stream_ignores_role_and_finish_chunks():
+    def chunk(content, choices=True):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))] if choices else [])
+
+    class Stream(list):
+        def close(self):
+            pass
+
+    stream = Stream([chunk(None), chunk('{"a": '), chunk(None), chunk("1}"), chunk(None), chunk(None, choices=False)])
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: stream)))
+    assert llm_interface._send_chat_completions(client, [], "model") == ('{"a": 1}', 0)
+
+def test_anthropic_payload_marks_system_and_first_user_turn_for_caching():
+    messages = [
+        {"role": "system", "content": "be terse"},
+        {"role": "user", "content": "structured prompt"},
+        {"role": "assistant", "content": "{}"},
+        {"role": "user", "content": "follow-up"},
+    ]
+    system, turns = llm_interface._anthropic_payload(messages)
+    assert system == [{"type": "text", "text": "be terse", "cache_control": {"type": "ephemeral"}}]
+    assert turns == [
+        {"role": "user", "content": [{"type": "text", "text": "structured prompt", "cache_control": {"type": "ephemeral"}}]},
+        {"role": "assistant", "content": "{}"},
+        {"role": "user", "content": "follow-up"},
+    ]
+    assert messages[1]["content"] == "structured prompt"           # input left untouched
+
+def test_anthropic_payload_without_system_prompt():
+    system, turns = llm_interface._anthropic_payload([{"role": "user", "content": "hi"}])
+    assert system == []
+    assert turns[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+
+def test_send_anthropic_reports_cache_read_tokens():
+    class Stream:
+        text_stream = iter(['{"a": ', "1}", " trailing"])
+        current_message_snapshot = SimpleNamespace(usage=SimpleNamespace(cache_read_input_tokens=1234))
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    requests = []
+
+    def stream(**kwargs):
+        requests.append(kwargs)
+        return Stream()
+
+    client = SimpleNamespace(messages=SimpleNamespace(stream=stream))
+    messages = [{"role": "system", "content": "s"}, {"role": "user", "content": "u"}]
+    assert llm_interface._send(client, "anthropic", messages, "model") == ('{"a": 1}', 1234)
+    assert requests[0]["system"][0]["cache_control"] == {"type": "ephemeral"}
+
+def test_retried_failures_are_not_reported_as_errors(monkeypatch, no_waiting, capsys):
+    failures = [google_exceptions.ServiceUnavailable("busy")]
+
+    def flaky_send(client, messages, model):
+        if failures:
+            raise failures.pop()
+        return '{"ok": 3}', 0
+
+    monkeypatch.setitem(llm_interface._PROVIDER_SEND, "openai", flaky_send)
+    assert _fetch() == '{"ok": 3}'
+    assert "[ERROR]" not in capsys.readouterr().out
@@ -0,0 +1,17 @@
+from src.main import AVG_LENGTHS, NUM_CHANGES, TOPOLOGIES, checkpoint_key, pending_sweeps
+from src.utils import append_checkpoint, load_checkpoint
+
+def test_pending_sweeps_covers_the_grid_in_run_order():
+    sweeps = pending_sweeps(set())
+    assert len(sweeps) == len(set(sweeps)) == len(AVG_LENGTHS) * len(NUM_CHANGES) * len(TOPOLOGIES)
+    assert sweeps[:4] == [("chain", 5, 1), ("branch", 5, 1), ("random", 5, 1), ("chain", 5, 2)]
+
+def test_resume_skips_checkpointed_sweeps(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    finished = pending_sweeps(set())[:7]
+    for topology, length, changes in finished:
+        append_checkpoint(path, checkpoint_key({"topology_mode": topology, "avg_length": length, "num_changes": changes}))
+
+    remaining = pending_sweeps(load_checkpoint(path))
+    assert remaining == pending_sweeps(set())[7:]
+    assert not set(finished) & set(remaining)
@@ -0,0 +1,86 @@
+import csv
+import subprocess
+import sys
+from pathlib import Path
+
+from src import utils
+from src.utils import append_checkpoint, append_results, flush_results, load_checkpoint, log_result, new_results
+
+def test_checkpoint_round_trip(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    assert load_checkpoint(path) == set()
+    append_checkpoint(path, ("chain", 5, 1))
+    append_checkpoint(path, ("random", 15, 5))
+    assert load_checkpoint(path) == {("chain", 5, 1), ("random", 15, 5)}
+
+def test_checkpoint_tolerates_partial_final_line(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    append_checkpoint(path, ("chain", 5, 1))
+    with open(path, "ab") as fh:
+        fh.write(b'{"key": ["branch", 7, \xe2\x80')      # crash mid-write, mid-character
+    assert load_checkpoint(path) == {("chain", 5, 1)}
+
+    # the next key lands on its own line instead of being glued to the torn one
+    append_checkpoint(path, ("branch", 7, 2))
+    assert load_checkpoint(path) == {("chain", 5, 1), ("branch", 7, 2)}
+
+def test_results_are_appended_in_an_existing_files_column_layout(tmp_path, monkeypatch):
+    path = tmp_path / "results.csv"
+    path.write_text("timestamp,topology,num_nodes\n", encoding="utf-8")     # written before cached_tokens existed
+    monkeypatch.setattr(utils, "CSV_FILE", str(path))
+    append_results([{"timestamp": "t", "topology": "chain", "num_nodes": 3, "cached_tokens": 9}])
+    flush_results()
+    utils._csv_writer.close()
+    assert path.read_text(encoding="utf-8").splitlines() == ["timestamp,topology,num_nodes", "t,chain,3"]
+
+def test_ratio_fields_keep_float64_precision():
+    record = new_results(1)[0]
+    record["pf_precision"] = 1 / 3
+    record["adj_match"] = 33.33
+    assert str(float(record["pf_precision"])) == str(1 / 3)
+    assert str(float(record["adj_match"])) == "33.33"
+
+def _rows(path):
+    with open(path, newline="", encoding="utf-8") as fh:
+        return list(csv.DictReader(fh))
+
+def _record(num_nodes):
+    record = new_results(1)[0]
+    record["num_nodes"] = num_nodes
+    return record
+
+def test_logged_rows_are_on_disk_after_flush_results(tmp_path, monkeypatch):
+    path = tmp_path / "results.csv"
+    monkeypatch.setattr(utils, "CSV_FILE", str(path))
+    for num_nodes in range(25):                  # more than one FLUSH_EVERY batch
+        log_result("Chain", _record(num_nodes))
+    flush_results()
+    rows = _rows(path)
+    assert [int(row["num_nodes"]) for row in rows] == list(range(25))
+    assert set(rows[0]) == set(utils.FIELDNAMES)
+    utils._csv_writer.close()
+
+def test_results_file_stays_valid_after_a_forced_close(tmp_path, monkeypatch):
+    path = tmp_path / "results.csv"
+    monkeypatch.setattr(utils, "CSV_FILE", str(path))
+    append_results([{"topology": "Chain", "num_nodes": 1}, {"topology": "Chain", "num_nodes": 2}])
+    utils._csv_writer.close()                    # as at exit, mid-run
+    append_results([{"topology": "Random", "num_nodes": 3}])
+    flush_results()
+    utils._csv_writer.close()
+    text = path.read_text(encoding="utf-8")
+    assert text.count("timestamp,") == 1         # reopening does not repeat the header
+    assert [(row["topology"], row["num_nodes"]) for row in _rows(path)] == [("Chain", "1"), ("Chain", "2"), ("Random", "3")]
+
+def test_queued_rows_are_written_at_exit_without_flush(tmp_path):
+    path = tmp_path / "results.csv"
+    script = (
+        "from src import utils\n"
+        f"utils.CSV_FILE = {str(path)!r}\n"
+        "for n in range(13):\n"
+        "    record = utils.new_results(1)[0]\n"
+        "    record['num_nodes'] = n\n"
+        "    utils.log_result('Branch', record)\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).resolve().parents[1], check=True)
+    assert [int(row["num_nodes"]) for row in _rows(path)] == list(range(13))